@@ -0,0 +1,163 @@
+// Clientside callbacks for the YNAB dashboard, the figures are rebuilt in the browser from the cube payload
+// created by create_cube_payload in dashboards/ynab.py, so the slider and account checklist never hit the server
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    ynab: {
+        create_graphs: function (payload, dateRangeValue, accountsList) {
+            if (!payload || !dateRangeValue || !accountsList) {
+                throw window.dash_clientside.PreventUpdate;
+            }
+            // The slider works in months, the figures use the finest resolution that keeps the plotted periods bounded
+            const resolution = payload.resolutions.find((resolution) =>
+                resolution.month_period[dateRangeValue[1]] - resolution.month_period[dateRangeValue[0]] < payload.max_periods
+            ) || payload.resolutions[payload.resolutions.length - 1];
+            const rows = resolution.rows, periods = resolution.periods;
+            const rangeMin = resolution.month_period[dateRangeValue[0]], rangeMax = resolution.month_period[dateRangeValue[1]];
+            const inRange = (period) => period >= rangeMin && period <= rangeMax;
+            const selectedAccounts = new Set(accountsList);
+            const periodCount = periods.length;
+
+            // Amounts are in cents, summed as integers and converted to dollars at the end
+            const inflow = new Array(periodCount).fill(0);
+            const outflow = new Array(periodCount).fill(0);
+            const periodPresent = new Array(periodCount).fill(false);
+            const accountBalance = payload.accounts.map(() => new Array(periodCount).fill(0));
+            const accountPresent = payload.accounts.map(() => new Array(periodCount).fill(false));
+            const categoryOutflow = new Map();
+            let totalIncome = 0, totalExpense = 0;
+
+            for (let i = 0; i < rows.period.length; i++) {
+                const account = rows.account[i], period = rows.period[i];
+                if (!selectedAccounts.has(payload.accounts[account])) {
+                    continue;
+                }
+                inflow[period] += rows.inflow[i];
+                outflow[period] += rows.outflow[i];
+                periodPresent[period] = true;
+                accountBalance[account][period] += rows.inflow[i] - rows.outflow[i];
+                accountPresent[account][period] = true;
+
+                if (inRange(period)) {
+                    totalIncome += rows.inflow[i];
+                    totalExpense += rows.outflow[i];
+                    // Transfers have no category and are left out of the sunburst
+                    if (rows.group[i] >= 0 && rows.category[i] >= 0) {
+                        const key = rows.group[i] + '/' + rows.category[i];
+                        categoryOutflow.set(key, (categoryOutflow.get(key) || 0) + rows.outflow[i]);
+                    }
+                }
+            }
+
+            // Savings and moving averages run over every period with transactions before the range is applied
+            const periodData = [];
+            let savings = 0;
+            for (let period = 0; period < periodCount; period++) {
+                if (!periodPresent[period]) {
+                    continue;
+                }
+                savings += inflow[period] - outflow[period];
+                const window = periodData.slice(-2).concat([{inflow: inflow[period], outflow: outflow[period]}]);
+                periodData.push({
+                    period: period, inflow: inflow[period], outflow: outflow[period], savings: savings,
+                    inflowAvg: window.reduce((total, row) => total + row.inflow, 0) / window.length,
+                    outflowAvg: window.reduce((total, row) => total + row.outflow, 0) / window.length,
+                });
+            }
+            const rangeData = periodData.filter((row) => inRange(row.period));
+            const rangePeriods = rangeData.map((row) => periods[row.period]);
+            const dollars = (rows, key) => rows.map((row) => row[key] / 100);
+
+            const incomeExpenseFig = {
+                data: [
+                    {type: 'bar', x: rangePeriods, y: dollars(rangeData, 'inflow'), name: 'Income', marker: {color: payload.colors[0]}},
+                    {type: 'bar', x: rangePeriods, y: dollars(rangeData, 'outflow'), name: 'Expenses', marker: {color: payload.colors[1]}},
+                    {type: 'scatter', x: rangePeriods, y: dollars(rangeData, 'inflowAvg'), name: '3-' + resolution.name + ' Income Avg', line: {dash: 'dash'}, marker: {color: payload.light_colors[0]}},
+                    {type: 'scatter', x: rangePeriods, y: dollars(rangeData, 'outflowAvg'), name: '3-' + resolution.name + ' Expenses Avg', line: {dash: 'dash'}, marker: {color: payload.light_colors[1]}},
+                    {type: 'scatter', x: rangePeriods, y: dollars(rangeData, 'savings'), name: 'Savings', mode: 'lines+markers', marker: {color: payload.light_colors[2]}},
+                ],
+                layout: {template: payload.template, title: {text: resolution.adjective + ' Income, Expenses, and Savings'}, barmode: 'group'},
+            };
+
+            // Sunburst leaves per category, parents per category group, plus the unspent money.
+            // Averages stay monthly whatever the resolution
+            const monthsInRange = resolution.period_months.slice(rangeMin, rangeMax + 1).reduce((total, months) => total + months, 0);
+            const leaves = Array.from(categoryOutflow.entries())
+                .map(([key, value]) => key.split('/').map(Number).concat([value]))
+                .filter(([group]) => payload.groups[group] !== 'Inflow')
+                .sort((a, b) => a[0] - b[0] || a[1] - b[1])
+                .map(([group, category, value]) => [payload.groups[group], payload.categories[category], value / 100]);
+            leaves.push(['Unspent', 'Unspent', (totalIncome - totalExpense) / 100]);
+            const parents = new Map();
+            leaves.forEach(([group, category, value]) => {
+                const parent = parents.get(group) || {value: 0, averages: new Set()};
+                parent.value += value;
+                parent.averages.add(Math.round(value / monthsInRange * 100) / 100);
+                parents.set(group, parent);
+            });
+            const parentEntries = Array.from(parents.entries());
+            const sunburst = {
+                type: 'sunburst', branchvalues: 'total', textinfo: 'label+percent entry',
+                ids: leaves.map(([group, category]) => group + '/' + category).concat(parentEntries.map(([group]) => group)),
+                labels: leaves.map(([, category]) => category).concat(parentEntries.map(([group]) => group)),
+                parents: leaves.map(([group]) => group).concat(parentEntries.map(() => '')),
+                values: leaves.map(([, , value]) => value).concat(parentEntries.map(([, parent]) => parent.value)),
+                // Like Plotly Express, a parent only shows an average when all its children agree on it
+                customdata: leaves.map(([, , value]) => [Math.round(value / monthsInRange * 100) / 100])
+                    .concat(parentEntries.map(([, parent]) => [parent.averages.size === 1 ? Array.from(parent.averages)[0] : '(?)'])),
+                hovertemplate: '<b>%{label}</b><br>Amount: $%{value}<br>Monthly Avg.: $%{customdata[0]}<br>',
+                domain: {x: [0, 1], y: [0, 1]},
+            };
+            const expenseCategoryFig = {
+                data: [sunburst],
+                layout: {template: payload.template, title: {text: 'Expenses by Category Group and Category'}, legend: {tracegroupgap: 0}},
+            };
+
+            // Closing balance per account, accumulated from the first period before the range is applied
+            const colorway = payload.template.layout.colorway;
+            let balanceTraces = [];
+            payload.accounts.forEach((account, idx) => {
+                if (!selectedAccounts.has(account)) {
+                    return;
+                }
+                const x = [], y = [];
+                let balance = 0;
+                for (let period = 0; period < periodCount; period++) {
+                    if (!accountPresent[idx][period]) {
+                        continue;
+                    }
+                    balance += accountBalance[idx][period];
+                    if (inRange(period)) {
+                        x.push(periods[period]);
+                        y.push(balance / 100);
+                    }
+                }
+                if (x.length === 0) {
+                    return;
+                }
+                balanceTraces.push({
+                    type: 'bar', name: account, x: x, y: y, text: y, texttemplate: '%{text:.2s}', textposition: 'inside',
+                    legendgroup: account, offsetgroup: account, alignmentgroup: 'True', orientation: 'v', showlegend: true,
+                    hovertemplate: 'Account=' + account + '<br>' + resolution.name + '=%{x}<br>Balance=%{y}<extra></extra>',
+                    firstPeriod: periods.indexOf(x[0]),
+                });
+            });
+            // Same trace order and colors as Plotly Express, accounts in order of their first period in the range
+            balanceTraces = balanceTraces
+                .map((trace, idx) => [trace, idx])
+                .sort((a, b) => a[0].firstPeriod - b[0].firstPeriod || a[1] - b[1])
+                .map(([trace], idx) => {
+                    delete trace.firstPeriod;
+                    return Object.assign(trace, {marker: {color: colorway[idx % colorway.length]}});
+                });
+            const accountBalanceFig = {
+                data: balanceTraces,
+                layout: {
+                    template: payload.template, title: {text: resolution.adjective + ' Closing Balance by Account'}, barmode: 'group',
+                    xaxis: {title: {text: resolution.name}}, yaxis: {title: {text: 'Account Balance'}},
+                    legend: {title: {text: 'Account'}, tracegroupgap: 0},
+                },
+            };
+
+            return [incomeExpenseFig, expenseCategoryFig, accountBalanceFig];
+        },
+    },
+});
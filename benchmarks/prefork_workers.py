@@ -0,0 +1,141 @@
+# Boots the app once and forks N workers from it the way gunicorn --preload does, then checks that every worker
+# gets working jobs, caches, database connections and logging of its own without corrupting the others.
+# A parent thread holds the store lock while forking, a worker that inherited it would deadlock.
+# Usage: python -m benchmarks.prefork_workers [--workers 4] [--timeout 60]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+SESSION = {'google_oauth_token': {'access_token': 'benchmark', 'token_type': 'Bearer'},
+           'email': 'worker@example.com', 'given_name': 'Worker'}
+
+
+def run_worker(app, worker, artists_per_worker):
+    from utils.db_util import db, save_artist_genres, fetch_cached_artist_genres
+    from utils.job_util import submit_job, get_job
+    from utils.store_util import get_dataset, get_dataset_load_count
+    from utils.auth_util import fingerprint_token
+
+    result = {'worker': worker, 'pid': os.getpid()}
+    with app.app_context():
+        # The parent's job executor threads don't exist here
+        job_key = ('benchmark', f'job-{worker}')
+        job_id = submit_job(job_key, lambda report_progress, value: value * 2, worker)
+        deadline = time.time() + 10
+        while get_job(job_key, job_id)['status'] not in ('done', 'failed') and time.time() < deadline:
+            time.sleep(0.05)
+        result['job'] = get_job(job_key, job_id)['result'] == worker * 2
+
+        # The parent's dataset must not leak into the worker's own store
+        frames = get_dataset('benchmark', 'user', 'v1', lambda: {'worker': worker})
+        result['store'] = frames == {'worker': worker} and get_dataset_load_count('benchmark', 'user', 'v1') == 1
+
+        artist_ids = [f'artist-{worker}-{i}' for i in range(artists_per_worker)]
+        save_artist_genres([{'id': artist_id, 'name': artist_id, 'genres': [str(worker)]} for artist_id in artist_ids])
+        db.session.remove()
+        result['db'] = len(fetch_cached_artist_genres(artist_ids)) == artists_per_worker
+
+        app.logger.info(f"Worker {worker} pid={os.getpid()}")
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(SESSION, id=f'user-{worker}', identity_loaded_at=time.time(),
+                       identity_token=fingerprint_token(SESSION['google_oauth_token']))
+    result['requests'] = [client.get(path).status_code for path in ['/welcome', '/ynab/_dash-layout', '/top_100/_dash-layout']]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--artists', type=int, default=500, help='Artists written to the database by each worker')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, root)
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    # saved_data and the log file are relative to the working directory
+    os.chdir(tempfile.mkdtemp())
+
+    import main as app_module
+    from utils.store_util import put_dataset, get_dataset, _dataset_store_lock
+    from utils.db_util import ArtistGenres, db
+    from utils.log_util import stop_logging
+    from utils.utils import save_data_to_disk
+
+    start = time.perf_counter()
+    app = app_module.create_app({'DASHBOARD_LOADING': 'eager', 'LOG_FILE': 'user.log',
+                                 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.abspath('sqlite.db')}"})
+    print(f'master boot with every dashboard loaded: {time.perf_counter() - start:.2f}s')
+    # The saved dataset the store entries stand for
+    save_data_to_disk('v1', 'version.json', save_folder='benchmark', userid='user')
+    put_dataset({'worker': 'master'}, 'benchmark', 'user', 'v1')
+
+    # Forking while another thread holds a lock is what happens to a master with background threads
+    lock_held = threading.Event()
+
+    def hold_lock():
+        with _dataset_store_lock:
+            lock_held.set()
+            time.sleep(1)
+
+    threading.Thread(target=hold_lock, daemon=True).start()
+    lock_held.wait()
+
+    workers = {}
+    for worker in range(args.workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                result = run_worker(app, worker, args.artists)
+            except Exception as e:
+                result = {'worker': worker, 'error': repr(e)}
+            os.write(write_fd, json.dumps(result).encode())
+            # os._exit skips atexit, the worker's queued log records are written out here
+            stop_logging()
+            os._exit(0)
+        os.close(write_fd)
+        workers[pid] = (worker, read_fd)
+
+    deadline = time.time() + args.timeout
+    ok = True
+    for pid, (worker, read_fd) in workers.items():
+        while os.waitpid(pid, os.WNOHANG) == (0, 0):
+            if time.time() > deadline:
+                os.kill(pid, 9)
+                os.waitpid(pid, 0)
+                break
+            time.sleep(0.05)
+        output = os.read(read_fd, 2 ** 16).decode()
+        result = json.loads(output) if output else {'worker': worker, 'error': 'timed out, probably deadlocked'}
+        passed = 'error' not in result and result['job'] and result['store'] and result['db'] and \
+            result['requests'] == [200, 200, 200]
+        ok &= passed
+        print(f"worker {worker}: {'ok' if passed else 'FAILED'} {result}")
+
+    with app.app_context():
+        rows = db.session.execute(db.select(db.func.count()).select_from(ArtistGenres)).scalar()
+    # Every worker writes a log file of its own, user.<pid>.log
+    logged = []
+    for pid, (worker, _) in workers.items():
+        if os.path.exists(f'user.{pid}.log'):
+            with open(f'user.{pid}.log') as f:
+                if f'Worker {worker} ' in f.read():
+                    logged.append(worker)
+    master_intact = get_dataset('benchmark', 'user', 'v1', lambda: None) == {'worker': 'master'}
+    ok &= rows == args.workers * args.artists and len(logged) == args.workers and master_intact
+    print(f'database rows: {rows}/{args.workers * args.artists}  workers in log: {len(logged)}/{args.workers}  '
+          f'master store intact: {master_intact}')
+    print('PASSED' if ok else 'FAILED')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
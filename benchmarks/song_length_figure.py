@@ -0,0 +1,33 @@
+# Report payload size and build time of the Top 100 song length figure as the number of tracks grows
+# Usage: python -m benchmarks.song_length_figure [--budget 1000000] [--threshold 1000]
+import time
+import argparse
+
+from dash_bootstrap_templates import load_figure_template
+
+from utils.utils import get_figure_size
+from dashboards.top_100 import create_song_length_figure, SONG_LENGTH_PAYLOAD_BUDGET, SONG_LENGTH_POINTS_THRESHOLD
+from benchmarks.synthetic import generate_top_100_tracks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=int, default=SONG_LENGTH_PAYLOAD_BUDGET)
+    parser.add_argument('--threshold', type=int, default=SONG_LENGTH_POINTS_THRESHOLD)
+    args = parser.parse_args()
+
+    load_figure_template("flatly")
+    for years, tracks_per_year in [(3, 100), (8, 100), (15, 100), (15, 1000)]:
+        tracks = generate_top_100_tracks(years=years, tracks_per_year=tracks_per_year)
+        playlist_years = sorted(tracks['playlist_year'].unique())
+
+        start = time.perf_counter()
+        song_length_fig, _ = create_song_length_figure(tracks, playlist_years, args.budget, args.threshold)
+        elapsed = time.perf_counter() - start
+
+        print(f'{len(tracks):>6} tracks: {get_figure_size(song_length_fig) / 1024:8.1f} KiB  '
+              f'{len(song_length_fig.data):>3} traces  build {elapsed:5.2f}s')
+
+
+if __name__ == '__main__':
+    main()
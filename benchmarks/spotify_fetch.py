@@ -0,0 +1,84 @@
+# Benchmark for the Top 100 Spotify fetch layer against a local stub server that injects latency
+# Usage: python -m benchmarks.spotify_fetch [--years 8] [--artists 600] [--latency 0.2] [--rate-limited 3]
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.spotify_util import create_spotify_client, fetch_playlists, fetch_artists
+
+
+def create_stub_handler(latency, rate_limited):
+    state = {'rate_limited': rate_limited}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            with lock:
+                throttle = state['rate_limited'] > 0
+                state['rate_limited'] -= throttle
+
+            url = urlparse(self.path)
+            if throttle:
+                self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}, {'Retry-After': '1'})
+            elif url.path.startswith('/v1/playlists/'):
+                playlist_id = url.path.rstrip('/').split('/')[-1]
+                self.send_json(200, {'id': playlist_id, 'tracks': {'items': []}})
+            elif url.path.startswith('/v1/artists'):
+                ids = parse_qs(url.query)['ids'][0].split(',')
+                self.send_json(200, {'artists': [{'id': i, 'name': i, 'genres': ['pop']} for i in ids]})
+            else:
+                self.send_json(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+        def send_json(self, status, body, headers=None):
+            body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def run_fetch(prefix, years, artists, max_workers):
+    sp = create_spotify_client('stub-token', max_workers=max_workers, prefix=prefix)
+    start = time.perf_counter()
+    fetch_playlists(sp, [f'playlist{i}' for i in range(years)], max_workers=max_workers)
+    fetch_artists(sp, [f'artist{i}' for i in range(artists)], max_workers=max_workers)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=8)
+    parser.add_argument('--artists', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--rate-limited', type=int, default=0, help='Number of requests answered with 429 first')
+    args = parser.parse_args()
+
+    for max_workers in (1, 4, 8):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), create_stub_handler(args.latency, args.rate_limited))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        prefix = f'http://127.0.0.1:{server.server_address[1]}/v1/'
+        elapsed = run_fetch(prefix, args.years, args.artists, max_workers)
+        print(f'max_workers={max_workers}: {elapsed:.2f}s')
+
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
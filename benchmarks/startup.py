@@ -0,0 +1,59 @@
+# Benchmark app startup: import cost of each dashboard module, boot time of main.py with lazy dashboards
+# and the wait of the first request to a dashboard. Every measurement runs in a fresh interpreter.
+# Usage: python -m benchmarks.startup [--repeat 3]
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+IMPORT_DASHBOARD = """
+import time, importlib
+import flask, dash
+start = time.perf_counter()
+importlib.import_module('dashboards.{file}')
+print(time.perf_counter() - start)
+"""
+
+BOOT_APP = """
+import time
+start = time.perf_counter()
+import main
+app = main.create_app()
+booted = time.perf_counter() - start
+start = time.perf_counter()
+app.test_client().get('{url}_dash-layout')
+print(booted, time.perf_counter() - start)
+"""
+
+
+def run_timed(code):
+    env = {**os.environ, 'FLASK_SECRET_KEY': os.environ.get('FLASK_SECRET_KEY', 'benchmark'), 'DASHBOARD_LOADING': 'lazy'}
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return [float(value) for value in result.stdout.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open('dashboards_config.json', 'r') as f:
+        dashboard_data_list = json.load(f)['dashboards']
+
+    # Flask and Dash are imported by main.py anyway, so only the dashboard's own imports are counted
+    print('import cost per dashboard (on top of flask and dash):')
+    for dashboard_metadata in dashboard_data_list:
+        times = [run_timed(IMPORT_DASHBOARD.format(file=dashboard_metadata['file']))[0] for _ in range(args.repeat)]
+        print(f"  {dashboard_metadata['file']:>10}: {statistics.median(times):6.2f}s")
+
+    print('boot of main.py and first request per dashboard:')
+    for dashboard_metadata in dashboard_data_list:
+        times = [run_timed(BOOT_APP.format(url=dashboard_metadata['url_base_pathname'])) for _ in range(args.repeat)]
+        print(f"  {dashboard_metadata['file']:>10}: boot {statistics.median(time[0] for time in times):6.2f}s  "
+              f"first request {statistics.median(time[1] for time in times):6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
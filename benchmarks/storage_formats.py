@@ -0,0 +1,46 @@
+# Benchmark write/read time and size on disk of the saved_data storage formats on a synthetic YNAB register
+# Usage: python -m benchmarks.storage_formats [--rows 1000000]
+import os
+import time
+import argparse
+import tempfile
+
+from utils.utils import storage_formats, save_dataframe_to_disk, fetch_dataframe_from_disk
+from benchmarks.synthetic import generate_ynab_register
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    register_df = generate_ynab_register(args.rows)
+    for column in ['Inflow', 'Outflow']:
+        register_df[column] = register_df[column].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
+
+    # saved_data paths are relative to the working directory
+    os.chdir(tempfile.mkdtemp())
+    for storage_format, (extension, _, reader) in storage_formats.items():
+        start = time.perf_counter()
+        save_dataframe_to_disk(register_df, 'register', save_folder='benchmark', userid=storage_format,
+                               storage_format=storage_format)
+        write_time = time.perf_counter() - start
+
+        path = os.path.join('saved_data', 'benchmark', storage_format, 'register' + extension)
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        df = reader(path)
+        read_time = time.perf_counter() - start
+
+        print(f'{storage_format:>8}: write {write_time:6.2f}s  read {read_time:6.2f}s  size {size / 2 ** 20:7.1f} MiB  '
+              f'dtypes preserved: {df.dtypes.equals(register_df.dtypes)}')
+
+    # Reading a legacy JSON file migrates it to the configured format
+    start = time.perf_counter()
+    fetch_dataframe_from_disk('register', save_folder='benchmark', userid='json')
+    print(f'migrate json: {time.perf_counter() - start:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
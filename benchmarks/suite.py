@@ -0,0 +1,206 @@
+# Benchmark suite timing every stage of the Top 100 and YNAB pipelines separately on synthetic data at several
+# scales, with the peak memory of each stage. --save-baseline stores the results, --compare checks a run against
+# them and exits with 1 when a stage got slower or hungrier than the tolerance allows.
+# Usage: python -m benchmarks.suite [--scales small medium large] [--repeat 3] [--only ynab]
+#                                   [--save-baseline | --compare] [--baseline benchmarks/baseline.json] [--tolerance 0.5]
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+from dash_bootstrap_templates import load_figure_template
+
+from dashboards.top_100 import (create_tracks_encoded, create_artist_presence, create_genre_year_counter,
+                                create_figures, create_song_occurance_flows)
+from dashboards.ynab import (read_csv_member, prepare_register, prepare_budget, parse_currency_cents, create_cubes,
+                             create_cube_payload, REGISTER_DTYPES, BUDGET_DTYPES, REGISTER_CURRENCY_COLUMNS,
+                             MAX_MEMORY_BYTES)
+from benchmarks.synthetic import (generate_ynab_register, generate_ynab_budget, generate_top_100_tracks,
+                                  generate_artist_genres)
+
+# YNAB register rows and Top 100 yearly playlists, tracks per playlist and distinct artists per scale
+SCALES = {
+    'small': {'ynab_rows': 1_000, 'top_100': {'years': 3, 'tracks_per_year': 100, 'artists': 1_000}},
+    'medium': {'ynab_rows': 10_000, 'top_100': {'years': 8, 'tracks_per_year': 100, 'artists': 2_000}},
+    'large': {'ynab_rows': 100_000, 'top_100': {'years': 15, 'tracks_per_year': 100, 'artists': 5_000}},
+    'xlarge': {'ynab_rows': 1_000_000, 'top_100': {'years': 15, 'tracks_per_year': 1_000, 'artists': 20_000}},
+}
+DEFAULT_SCALES = ['small', 'medium', 'large']
+# Differences below these are noise whatever the ratio
+MIN_SECONDS_DIFFERENCE = 0.01
+MIN_PEAK_BYTES_DIFFERENCE = 2 ** 20
+
+
+def calibrate(repeat=5):
+    # A fixed pandas workload timed alongside the stages, comparisons are scaled by how much faster or slower it
+    # ran than when the baseline was saved, so a busy or throttled machine doesn't look like a regression
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'key': rng.integers(0, 1000, 200_000), 'value': rng.random(200_000)})
+    df['label'] = df['key'].astype(str)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df.groupby('label')['value'].sum()
+        df['label'].str.len()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_stage(results, key, func, setup, repeat):
+    # Fastest wall time over the repeats after an untimed warm-up run, the least noisy figure to compare, then one
+    # more run under tracemalloc for the peak memory since tracing slows the stage down.
+    # setup() builds fresh inputs outside the timing for stages that modify them
+    func(*setup())
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        output = func(*args)
+        times.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    func(*args)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results[key] = {'seconds': min(times), 'peak_bytes': peak_bytes}
+    print(f'  {key:<45} {results[key]["seconds"]:8.3f}s  peak {peak_bytes / 2 ** 20:8.1f} MiB')
+    return output
+
+
+def benchmark_ynab(results, scale, rows, repeat):
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('Budget Register.csv', generate_ynab_register(rows).to_csv(index=False))
+        zip_file.writestr('Budget Plan.csv', generate_ynab_budget().to_csv(index=False))
+
+    def read_member(index, dtype):
+        with ZipFile(buffer) as zip_file:
+            return read_csv_member(zip_file, zip_file.infolist()[index], MAX_MEMORY_BYTES, dtype)
+
+    key = f'ynab/{scale}'
+    raw_register_df = run_stage(results, f'{key}/csv_parse', lambda: read_member(0, REGISTER_DTYPES), lambda: (), repeat)
+    run_stage(results, f'{key}/currency_cleaning',
+              lambda df: [parse_currency_cents(df[column]) for column in REGISTER_CURRENCY_COLUMNS],
+              lambda: (raw_register_df,), repeat)
+    # Currency cleaning, date parsing and the month key, prepare_register converts the columns in place
+    register_df = run_stage(results, f'{key}/prepare_register', prepare_register, lambda: (raw_register_df.copy(),), repeat)
+    budget_df = prepare_budget(read_member(1, BUDGET_DTYPES))
+
+    cubes = run_stage(results, f'{key}/create_cubes', create_cubes, lambda: (register_df, budget_df), repeat)
+    # The server side of create_graphs, the figures themselves are built from this payload in the browser
+    payload = run_stage(results, f'{key}/graphs_aggregation', create_cube_payload, lambda: (cubes,), repeat)
+    payload_json = run_stage(results, f'{key}/serialization', to_json_plotly, lambda: (payload,), repeat)
+    results[f'{key}/serialization']['output_bytes'] = len(payload_json)
+
+
+def count_genres(artist_presence, artist_genres, years):
+    # As in fetch_top_100_data, with the genres coming from the synthetic Spotify responses
+    artist_presence['genres'] = artist_presence['artist'].map(lambda artist: artist_genres.get(artist, []))
+    return create_genre_year_counter(artist_presence, years)
+
+
+def benchmark_top_100(results, scale, years, tracks_per_year, artists, repeat):
+    tracks = generate_top_100_tracks(years=years, tracks_per_year=tracks_per_year, artists=artists)
+    tracks['my_id'] = tracks['name'] + "--" + tracks['artists'].apply(', '.join) + "--" + tracks['album']
+    artist_genres = generate_artist_genres(artists=artists)
+
+    key = f'top_100/{scale}'
+    tracks_encoded, playlist_years = run_stage(results, f'{key}/encode_tracks', create_tracks_encoded,
+                                               lambda: (tracks,), repeat)
+    artist_presence = run_stage(results, f'{key}/artist_presence', create_artist_presence,
+                                lambda: (tracks_encoded, playlist_years), repeat)
+    genre_year_counter = run_stage(results, f'{key}/genre_counter', count_genres,
+                                   lambda: (artist_presence, artist_genres, playlist_years), repeat)
+
+    datasets = {'tracks': tracks, 'tracks_encoded': tracks_encoded, 'artist_presence': artist_presence,
+                'genre_year_counter': genre_year_counter}
+    *figures, color_map = run_stage(results, f'{key}/create_figures', create_figures,
+                                    lambda: (datasets, playlist_years), repeat)
+    flow_figures = run_stage(results, f'{key}/song_occurance_flows', create_song_occurance_flows,
+                             lambda: (tracks_encoded, playlist_years, json.loads(color_map)), repeat)
+
+    # Everything the two figure callbacks send to the browser, every year's flow figures included
+    all_figures = figures + [figure for year_figures in flow_figures.values() for figure in year_figures]
+    figures_json = run_stage(results, f'{key}/serialization',
+                             lambda: [to_json_plotly(figure) for figure in all_figures], lambda: (), repeat)
+    results[f'{key}/serialization']['output_bytes'] = sum(len(figure_json) for figure_json in figures_json)
+
+
+def compare_results(results, baseline, machine_speed, tolerance):
+    regressions = []
+    print(f'\nmachine speed against the baseline run: {machine_speed:.2f}x, baseline times are scaled by it')
+    print(f'{"stage":<45} {"time":>9} {"baseline":>9} {"ratio":>6}  {"peak":>9} {"baseline":>9} {"ratio":>6}')
+    for key, result in results.items():
+        if key not in baseline:
+            print(f'{key:<45} {result["seconds"]:8.3f}s  (not in baseline)')
+            continue
+        base = dict(baseline[key], seconds=baseline[key]['seconds'] * machine_speed)
+        time_ratio = result['seconds'] / max(base['seconds'], 1e-9)
+        peak_ratio = result['peak_bytes'] / max(base['peak_bytes'], 1)
+        slower = time_ratio > 1 + tolerance and result['seconds'] - base['seconds'] > MIN_SECONDS_DIFFERENCE
+        hungrier = peak_ratio > 1 + tolerance and result['peak_bytes'] - base['peak_bytes'] > MIN_PEAK_BYTES_DIFFERENCE
+        flag = '  REGRESSION' if slower or hungrier else ''
+        print(f'{key:<45} {result["seconds"]:8.3f}s {base["seconds"]:8.3f}s {time_ratio:6.2f}  '
+              f'{result["peak_bytes"] / 2 ** 20:6.1f}MiB {base["peak_bytes"] / 2 ** 20:6.1f}MiB {peak_ratio:6.2f}{flag}')
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', nargs='+', choices=SCALES,
+                        help='By default small medium large, or the scales of the baseline with --compare')
+    parser.add_argument('--only', choices=['ynab', 'top_100'], help='Run only one of the pipelines')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--save-baseline', action='store_true', help='Store the results as the baseline')
+    mode.add_argument('--compare', action='store_true', help='Compare the results against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed slowdown and memory growth, 0.5 = 50%%')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        # Earlier scales warm the process up, timings only compare when the same scales ran in the same order
+        if args.scales is not None and args.scales != baseline['scales']:
+            print(f'warning: the baseline ran --scales {" ".join(baseline["scales"])}, timings may not compare')
+    scales = args.scales or (baseline['scales'] if baseline is not None else DEFAULT_SCALES)
+
+    load_figure_template("flatly")
+    calibration = calibrate()
+    results = {}
+    for scale in scales:
+        print(f'{scale}:')
+        if args.only in (None, 'ynab'):
+            benchmark_ynab(results, scale, SCALES[scale]['ynab_rows'], args.repeat)
+        if args.only in (None, 'top_100'):
+            benchmark_top_100(results, scale, repeat=args.repeat, **SCALES[scale]['top_100'])
+    # Calibrated before and after the stages to follow the machine's load through the run
+    calibration = (calibration + calibrate()) / 2
+
+    if args.save_baseline:
+        # Timings only compare on the same machine, the versions help telling apart library changes
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'pandas': pd.__version__, 'calibration': calibration,
+                       'scales': scales, 'results': results}, f, indent=2)
+        print(f'\nbaseline saved to {args.baseline}')
+    elif args.compare:
+        regressions = compare_results(results, baseline['results'], calibration / baseline['calibration'], args.tolerance)
+        print(f'\n{len(regressions)} regression(s)' + (': ' + ', '.join(regressions) if regressions else ''))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# Synthetic inputs shaped like the real dashboard data, used by the benchmarks
+import numpy as np
+import pandas as pd
+
+ynab_accounts = ['Checking', 'Savings', 'Credit Card', 'Cash', 'Brokerage']
+ynab_categories = {
+    'Inflow': ['Ready to Assign'],
+    'Bills': ['Rent', 'Electric', 'Water', 'Internet', 'Phone'],
+    'Everyday': ['Groceries', 'Dining Out', 'Transport', 'Household'],
+    'Fun': ['Entertainment', 'Hobbies', 'Vacation'],
+    'Savings Goals': ['Emergency Fund', 'New Car'],
+}
+
+
+def format_currency(values):
+    # Same shape as the YNAB export, e.g. $1,234.56 and -$12.30
+    values = pd.Series(values)
+    return values.abs().map('${:,.2f}'.format).where(values >= 0, '-' + values.abs().map('${:,.2f}'.format))
+
+
+def generate_ynab_register(rows, months=36, seed=0):
+    rng = np.random.default_rng(seed)
+    category_pairs = [(group, category) for group, categories in ynab_categories.items() for category in categories]
+    category_idx = rng.integers(0, len(category_pairs), rows)
+    category_groups = np.array([pair[0] for pair in category_pairs])[category_idx]
+    categories = np.array([pair[1] for pair in category_pairs])[category_idx]
+
+    dates = pd.Timestamp('today').normalize() - pd.to_timedelta(rng.integers(0, months * 30, rows), unit='D')
+    amounts = rng.gamma(2, 40, rows).round(2)
+    is_inflow = category_groups == 'Inflow'
+
+    return pd.DataFrame({
+        'Account': np.array(ynab_accounts)[rng.integers(0, len(ynab_accounts), rows)],
+        'Flag': np.where(rng.random(rows) < 0.05, 'Red', None),
+        'Date': dates.strftime('%m/%d/%Y'),
+        'Payee': np.char.add('Payee ', rng.integers(0, 500, rows).astype(str)),
+        'Category Group/Category': np.char.add(np.char.add(category_groups, ': '), categories),
+        'Category Group': category_groups,
+        'Category': categories,
+        'Memo': np.where(rng.random(rows) < 0.3, 'memo', None),
+        'Outflow': format_currency(np.where(is_inflow, 0, amounts)),
+        'Inflow': format_currency(np.where(is_inflow, amounts * 20, 0)),
+        'Cleared': np.where(rng.random(rows) < 0.9, 'Cleared', 'Uncleared'),
+    }).sort_values('Date', ignore_index=True)
+
+
+def generate_ynab_budget(months=36, seed=0):
+    rng = np.random.default_rng(seed)
+    month_labels = pd.period_range(end=pd.Timestamp('today'), periods=months, freq='M').strftime('%b %Y')
+    rows = [(month, group, category) for month in month_labels
+            for group, categories in ynab_categories.items() if group != 'Inflow' for category in categories]
+    budget = pd.DataFrame(rows, columns=['Month', 'Category Group', 'Category'])
+    budget.insert(1, 'Category Group/Category', budget['Category Group'] + ': ' + budget['Category'])
+    budget['Budgeted'] = format_currency(rng.gamma(2, 100, len(budget)).round(2))
+    budget['Activity'] = format_currency(-rng.gamma(2, 90, len(budget)).round(2))
+    budget['Available'] = format_currency(rng.normal(20, 50, len(budget)).round(2))
+    return budget
+
+
+def generate_top_100_tracks(years=8, tracks_per_year=100, artists=2000, repeat_share=0.3, seed=0):
+    # Tracks rows as built by the Top 100 fetch, with some songs repeating across yearly playlists
+    rng = np.random.default_rng(seed)
+    song_pool = int(years * tracks_per_year * (1 - repeat_share)) + tracks_per_year
+    song_artists = [[f'Artist {i}' for i in rng.choice(artists, rng.integers(1, 4), replace=False)]
+                    for _ in range(song_pool)]
+    song_durations = rng.normal(210, 45, song_pool).clip(60, 600).round(3)
+
+    tracks = []
+    for year in range(2023 - years + 1, 2024):
+        for song in rng.choice(song_pool, tracks_per_year, replace=False):
+            tracks.append({
+                "name": f"Song {song}",
+                "artists": song_artists[song],
+                "album": f"Album {song // 3}",
+                "release_year": str(year - int(rng.integers(0, 10))),
+                "duration": song_durations[song],
+                "track_id": f"track{song}",
+                "artist_id": [artist.replace('Artist ', 'artist') for artist in song_artists[song]],
+                "album_id": f"album{song // 3}",
+                "playlist_year": str(year),
+                "playlist_name": f"Your Top Songs {year}"
+            })
+    return pd.DataFrame(tracks)
+
+
+def generate_artist_genres(artists=2000, genres=300, seed=0):
+    # Genres per artist as returned by the Spotify artists endpoint, named like generate_top_100_tracks' artists.
+    # A few popular genres are shared by many artists, some artists have none
+    rng = np.random.default_rng(seed)
+    genre_names = np.array([f'genre {i}' for i in range(genres)])
+    weights = 1 / np.arange(1, genres + 1)
+    weights /= weights.sum()
+    return {f'Artist {i}': rng.choice(genre_names, rng.integers(0, 5), replace=False, p=weights).tolist()
+            for i in range(artists)}
@@ -0,0 +1,61 @@
+# Benchmark parse time and memory of the YNAB register ingestion, untyped regex/float path against the typed one
+# Usage: python -m benchmarks.ynab_ingest [--rows 1000000]
+import io
+import time
+import argparse
+import tracemalloc
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import pandas as pd
+
+from dashboards.ynab import read_csv_member, prepare_register, REGISTER_DTYPES, MAX_MEMORY_BYTES
+from benchmarks.synthetic import generate_ynab_register
+
+
+def parse_untyped(zip_file, member):
+    # The ingestion before typed dtypes, inferred columns and a regex pass per currency column
+    register_df = read_csv_member(zip_file, member, MAX_MEMORY_BYTES)
+    for column in ['Inflow', 'Outflow']:
+        register_df[column] = register_df[column].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
+    # The figures reparsed the dates on every update
+    register_df['Date'] = pd.to_datetime(register_df['Date'])
+    return register_df
+
+
+def parse_typed(zip_file, member):
+    return prepare_register(read_csv_member(zip_file, member, MAX_MEMORY_BYTES, REGISTER_DTYPES))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('Budget Register.csv', generate_ynab_register(args.rows).to_csv(index=False))
+
+    results = {}
+    for name, parse in [('untyped', parse_untyped), ('typed', parse_typed)]:
+        with ZipFile(buffer) as zip_file:
+            start = time.perf_counter()
+            df = parse(zip_file, zip_file.infolist()[0])
+            elapsed = time.perf_counter() - start
+
+            # Traced separately since tracemalloc slows the parse down considerably
+            tracemalloc.start()
+            parse(zip_file, zip_file.infolist()[0])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results[name] = df
+        print(f'{name:>8}: parse {elapsed:6.2f}s  peak {peak / 2 ** 20:7.1f} MiB  '
+              f'frame {df.memory_usage(deep=True).sum() / 2 ** 20:7.1f} MiB')
+
+    # Both paths should agree on the amounts
+    for column in ['Inflow', 'Outflow']:
+        matches = ((results['untyped'][column] * 100).round().astype('int64') == results['typed'][column]).all()
+        print(f'{column} matches: {matches}')
+
+
+if __name__ == '__main__':
+    main()
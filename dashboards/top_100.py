@@ -5,26 +5,367 @@ import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import load_figure_template
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 
-from flask import session, redirect, url_for, request
+from flask import session
 from urllib.parse import urlencode, urlparse, urlunparse, parse_qs
 
+import numpy as np
 import pandas as pd
-from collections import Counter
 from sklearn.preprocessing import MultiLabelBinarizer
+from scipy.stats import gaussian_kde
 import json
 
-import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from spotipy.cache_handler import FlaskSessionCacheHandler
 
 from utils.utils import *
+from utils.store_util import *
+from utils.spotify_util import *
+from utils.db_util import fetch_cached_artist_genres, save_artist_genres
+from utils.job_util import submit_job, get_job, get_active_job
+from utils.metrics_util import measure_phase
 
 
 # stylesheet with the .dbc class from dash-bootstrap-templates library
 dbc_css = "https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates/dbc.min.css"
 fa_css = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.3.0/css/all.min.css"
 
+dataset_names = ['tracks', 'tracks_encoded', 'artist_presence', 'genre_year_counter']
+
+# Above these the song length violin switches to server-side statistics with sampled points
+SONG_LENGTH_PAYLOAD_BUDGET = 1000000  # bytes of figure JSON
+SONG_LENGTH_POINTS_THRESHOLD = 1000  # tracks
+SONG_LENGTH_KDE_GRID_SIZE = 100
+
+
+def load_saved_datasets(save_folder, userid):
+    return {name: fetch_dataframe_from_disk(name, save_folder=save_folder, userid=userid) for name in dataset_names}
+
+
+def parse_playlist_tracks(response, playlist_year, playlist_name):
+    return [{
+        "name": item['track']['name'],
+        "artists": [i['name'] for i in item['track']['artists']],
+        "album": item['track']['album']['name'],
+        "release_year": item['track']['album']['release_date'][:4],
+        "duration": item['track']['duration_ms'] / 1000,
+        "track_id": item['track']['id'],
+        "artist_id": [i['id'] for i in item['track']['artists']],
+        "album_id": item['track']['album']['id'],
+        "playlist_year": playlist_year,
+        "playlist_name": playlist_name
+    } for item in response['tracks']['items']]
+
+
+def fetch_playlist_tracks(sp, playlists, save_folder, userid):
+    # Past "Your Top Songs" playlists never change, so only new playlists or ones with a new snapshot are downloaded
+    playlist_tracks = {}
+    for idx, row in playlists.iterrows():
+        filename = f'playlist_{row["playlist_id"]}.json'
+        if check_if_saved_data_exists([filename], save_folder=save_folder, userid=userid):
+            saved_playlist = json.loads(fetch_data_from_disk(filename, save_folder=save_folder, userid=userid))
+            if saved_playlist['snapshot_id'] == row["snapshot_id"]:
+                playlist_tracks[row["playlist_id"]] = saved_playlist['tracks']
+
+    stale_playlists = playlists[~playlists["playlist_id"].isin(playlist_tracks)]
+    playlist_responses = fetch_playlists(sp, stale_playlists["playlist_id"].to_list())
+    for (idx, row), response in zip(stale_playlists.iterrows(), playlist_responses):
+        tracks = parse_playlist_tracks(response, row["playlist_year"], row["playlist_name"])
+        saved_playlist = json.dumps({'snapshot_id': response['snapshot_id'], 'tracks': tracks})
+        save_data_to_disk(saved_playlist, f'playlist_{row["playlist_id"]}.json', save_folder=save_folder, userid=userid)
+        playlist_tracks[row["playlist_id"]] = tracks
+
+    return [track for playlist_id in playlists["playlist_id"] for track in playlist_tracks[playlist_id]]
+
+
+def fetch_artist_genres(sp, artist_ids):
+    # Artists are shared between users, so the lookup goes through the cross-user cache before Spotify
+    artists = fetch_cached_artist_genres(artist_ids)
+
+    missing_artist_ids = [artist_id for artist_id in artist_ids if artist_id not in artists]
+    if missing_artist_ids:
+        fetched_artists = fetch_artists(sp, missing_artist_ids)
+        save_artist_genres(fetched_artists)
+        artists.update({item['id']: {'name': item['name'], 'genres': item['genres']} for item in fetched_artists})
+
+    return {artist['name']: artist['genres'] for artist in artists.values()}
+
+
+def create_tracks_encoded(tracks):
+    # One row per song with a 0/1 column per playlist year it appears in
+    temp = tracks.groupby('my_id').playlist_year.apply(list).reset_index()
+    temp = temp.merge(tracks.drop(['playlist_year', 'playlist_name'], axis=1), on='my_id', how='left')
+
+    mlb = MultiLabelBinarizer()
+
+    tracks_encoded = pd.concat(
+        [temp, pd.DataFrame(mlb.fit_transform(temp['playlist_year']), columns=mlb.classes_, index=temp.index)],
+        axis=1)
+    tracks_encoded = tracks_encoded.drop_duplicates('my_id').reset_index(drop=True)
+    tracks_encoded = tracks_encoded.drop('playlist_year', axis=1)
+
+    years = list(mlb.classes_)
+
+    tracks_encoded["occurances"] = tracks_encoded[years].sum(axis=1)
+    return tracks_encoded, years
+
+
+def create_artist_presence(tracks_encoded, years):
+    # One row per (track, artist), a track listing the same artist twice still counts once
+    track_artists = tracks_encoded[['artists'] + years].explode('artists').dropna(subset=['artists'])
+    track_artists = track_artists[~track_artists.reset_index().duplicated(['index', 'artists']).to_numpy()]
+
+    artist_presence = track_artists.groupby('artists')[years].sum()
+    artist_presence = artist_presence.rename_axis('artist').reset_index()[years + ['artist']]
+    artist_presence['occurances'] = artist_presence[years].sum(axis=1)
+    artist_presence = artist_presence.sort_values('occurances', ascending=False, kind='stable')
+    return artist_presence
+
+
+def create_genre_year_counter(artist_presence, years, top_n=5):
+    # Artists missing from the Spotify response have no genres instead of NaN
+    genres = artist_presence['genres'].map(lambda x: x if isinstance(x, list) else [])
+
+    # One row per (artist, genre) weighted by the artist's presence in each year
+    artist_genres = artist_presence[years].assign(genre=genres).explode('genre').dropna(subset=['genre'])
+    genre_counts = artist_genres.groupby('genre')[years].sum()
+
+    top_genres = genre_counts.sum(axis=1).sort_values(ascending=False, kind='stable').head(top_n).index
+    genre_year_counter = genre_counts.reindex(top_genres, fill_value=0).astype(int).rename_axis(None)
+    return genre_year_counter.T
+
+
+def create_song_length_figure(tracks, years, payload_budget=SONG_LENGTH_PAYLOAD_BUDGET,
+                              points_threshold=SONG_LENGTH_POINTS_THRESHOLD):
+    if len(tracks) <= points_threshold:
+        song_length_fig = px.violin(tracks, x="playlist_year", y="duration", color="playlist_year", box=True,
+                                    points="all", hover_data=['name', 'artists', 'album', 'duration'],
+                                    labels={
+                                        "playlist_year": "Year",
+                                        "duration": "Song Length (secs)",
+                                        "name": "Title",
+                                        "artists": "Artist(s)",
+                                        "album": "Album"
+                                    },
+                                    title="Song Length Across Years",
+                                    height=600)
+
+        # Set color map for consistency
+        color_map = {i['name']: i['marker']['color'] for i in song_length_fig['data']}
+        if get_figure_size(song_length_fig) <= payload_budget:
+            return song_length_fig, color_map
+
+    # Too many tracks to ship every point, so the shape is computed here and only a sample of the points is sent
+    colorway = pio.templates[pio.templates.default].layout.colorway
+    color_map = {year: colorway[idx % len(colorway)] for idx, year in enumerate(years)}
+
+    max_points = min(len(tracks), points_threshold)
+    song_length_fig = create_song_length_summary_figure(tracks, years, color_map, max_points)
+    while get_figure_size(song_length_fig) > payload_budget and max_points > 0:
+        max_points //= 2
+        song_length_fig = create_song_length_summary_figure(tracks, years, color_map, max_points)
+
+    return song_length_fig, color_map
+
+
+def create_song_length_summary_figure(tracks, years, color_map, max_points):
+    song_length_fig = go.Figure()
+    points = tracks.sample(n=min(len(tracks), max_points), random_state=0)
+
+    for idx, year in enumerate(years):
+        durations = tracks.loc[tracks['playlist_year'] == year, 'duration'].to_numpy()
+        if len(durations) == 0:
+            continue
+
+        # Violin outline from a server-side KDE, scaled to the same half width for every year
+        if len(durations) > 1 and durations.std() > 0:
+            grid = np.linspace(durations.min(), durations.max(), SONG_LENGTH_KDE_GRID_SIZE)
+            density = gaussian_kde(durations, bw_method='silverman')(grid)
+            density = density / density.max() * 0.4
+            song_length_fig.add_trace(go.Scatter(
+                x=np.concatenate([idx - density, (idx + density)[::-1]]),
+                y=np.concatenate([grid, grid[::-1]]),
+                fill='toself', mode='lines', line_color=color_map[year],
+                name=year, legendgroup=year, hoverinfo='skip',
+            ))
+
+        q1, median, q3 = np.percentile(durations, [25, 50, 75])
+        iqr = q3 - q1
+        song_length_fig.add_trace(go.Box(
+            x=[idx], q1=[q1], median=[median], q3=[q3],
+            lowerfence=[durations[durations >= q1 - 1.5 * iqr].min()],
+            upperfence=[durations[durations <= q3 + 1.5 * iqr].max()],
+            width=0.1, marker_color=color_map[year],
+            name=year, legendgroup=year, showlegend=False,
+        ))
+
+        year_points = points[points['playlist_year'] == year]
+        song_length_fig.add_trace(go.Scattergl(
+            x=idx + np.random.default_rng(idx).uniform(-0.15, 0.15, len(year_points)),
+            y=year_points['duration'],
+            hovertext=year_points['name'] + ' - ' + year_points['artists'].str.join(', '),
+            hoverinfo='text+y', mode='markers', marker=dict(color=color_map[year], size=3, opacity=0.5),
+            name=year, legendgroup=year, showlegend=False,
+        ))
+
+    song_length_fig.update_layout(
+        xaxis=dict(title='Year', tickvals=list(range(len(years))), ticktext=years),
+        yaxis=dict(title='Song Length (secs)'),
+        title=f'Song Length Across Years (showing {len(points)} of {len(tracks)} songs)',
+        height=600)
+    return song_length_fig
+
+
+def create_figures(datasets, years, payload_budget=SONG_LENGTH_PAYLOAD_BUDGET,
+                   points_threshold=SONG_LENGTH_POINTS_THRESHOLD):
+    tracks = datasets['tracks']
+    artist_presence = datasets['artist_presence']
+    genre_year_counter = datasets['genre_year_counter']
+
+    # Create song-length-graph
+    song_length_fig, color_map = create_song_length_figure(tracks, years, payload_budget, points_threshold)
+
+    artist_occurance_fig = px.imshow(artist_presence[years].head(10).values.tolist(),
+                                     labels=dict(x="Year", y="Artist", color="Occurances"),
+                                     x=years,
+                                     y=artist_presence.artist.to_list()[:10],
+                                     height=800,
+                                     title="Presence Of Your Top 10 Artists")
+    artist_occurance_fig.update_xaxes(side="top")
+
+    top_genre_fig = go.Figure()
+
+    for idx, row in genre_year_counter.iterrows():
+        top_genre_fig.add_trace(go.Scatterpolar(
+            r=row,
+            theta=genre_year_counter.columns,
+            fill='toself',
+            name=idx
+        ))
+
+    top_genre_fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True
+            )),
+        height=800,
+        title='Presence Of Your Top 5 Genres')
+
+    color_map = json.dumps(color_map)
+    return song_length_fig, artist_occurance_fig, top_genre_fig, color_map
+
+
+def create_song_occurance_flows(tracks_encoded, years, color_map):
+    # The dimensions and the sorted song details are shared by every year, only the highlighted year changes
+    dims = []
+    for year in years:
+        dims.append(go.parcats.Dimension(
+            values=tracks_encoded[year],
+            label=year, categoryarray=[1, 0],
+            ticktext=['Top 100 🕪', '🔇']
+        ))
+
+    songs = tracks_encoded[tracks_encoded['occurances'] > 1]
+    songs = songs.sort_values(['occurances'] + years[::-1], ascending=False)
+    songs_text = songs[['name', 'artists', 'album'] + years].copy()
+    songs_text['artists'] = songs_text['artists'].str.join(', ')
+    for year in years:
+        songs_text[year] = songs_text[year].map({1: 'Top 100 🕪', 0: '🔇'})
+
+    header_values = ['<b>Title</b>', '<b>Artist(s)</b>', '<b>Album</b>'] + [f'<b>{i}</b>' for i in years]
+
+    flow_figures = {}
+    for year_filter in years:
+        # Create parcats trace
+        color = tracks_encoded[year_filter]
+        colorscale = [[0, 'lightsteelblue'], [1, color_map[year_filter]]]
+
+        g1 = go.Figure(data=[go.Parcats(dimensions=dims,
+                                        line={'color': color, 'colorscale': colorscale},
+                                        hoveron='color', hoverinfo='skip',
+                                        arrangement='freeform')],
+                       layout=go.Layout(title=f'{year_filter} Song Occurance Flow'))
+
+        in_year = (songs[year_filter] == 1).to_numpy()
+        temp = songs_text[in_year]
+        color_values = [["#EBF0F8"] * len(temp), ["#EBF0F8"] * len(temp), ["#EBF0F8"] * len(temp)] + [
+            np.where(songs.loc[in_year, i] == 0, "#EBF0F8", color_map[i]).tolist() for i in years]
+        cell_values = [temp[i] for i in temp.columns]
+
+        g2 = go.Figure(data=[go.Table(
+            header=dict(
+                values=header_values,
+                line_color='white', fill_color='white',
+                align='center', font=dict(color='black', size=12)),
+            cells=dict(
+                values=cell_values,
+                fill_color=color_values))],
+            layout=go.Layout(height=1000, title=f'{year_filter} Songs Details'))
+
+        flow_figures[year_filter] = (g1, g2)
+
+    return flow_figures
+
+
+def fetch_top_100_data(report_progress, sp, save_folder, userid):
+    report_progress(5, 'Finding your Top Songs playlists')
+    response = call_with_retry(sp.current_user_playlists)
+
+    # Download and process "Your Top Songs" playlists
+    playlists = []
+    for item in response['items']:
+        if item['name'].startswith("Your Top Songs") and item['owner']['display_name'] == "Spotify":
+            playlists.append({
+                "playlist_year": item["name"][-4:],
+                "playlist_name": item["name"],
+                "playlist_id": item["id"],
+                "snapshot_id": item["snapshot_id"]
+            })
+
+    playlists = pd.DataFrame(playlists)
+    playlists = playlists.sort_values("playlist_year", ignore_index=True)
+
+    # Download and process tracks from the playlists
+    report_progress(15, f'Downloading {len(playlists)} playlists')
+    tracks = fetch_playlist_tracks(sp, playlists, save_folder=save_folder, userid=userid)
+
+    tracks = pd.DataFrame(tracks)
+    tracks['my_id'] = tracks['name'] + "--" + tracks['artists'].apply(', '.join) + "--" + tracks['album']
+
+    # Create tracks_encoded table
+    report_progress(45, 'Processing tracks')
+    tracks_encoded, years = create_tracks_encoded(tracks)
+
+    # Create artist-occurance-graph
+    artist_presence = create_artist_presence(tracks_encoded, years)
+
+    # Download and process genre
+    report_progress(60, 'Fetching artist genres')
+    artist_ids = list(set([j for i in tracks_encoded.artist_id.to_list() for j in i]))
+
+    artist_genres = fetch_artist_genres(sp, artist_ids)
+
+    artist_presence['genres'] = artist_presence['artist'].map(lambda artist: artist_genres.get(artist, []))
+
+    genre_year_counter = create_genre_year_counter(artist_presence, years)
+
+    report_progress(90, 'Saving your data')
+    datasets = {
+        'tracks': tracks,
+        'tracks_encoded': tracks_encoded,
+        'artist_presence': artist_presence,
+        'genre_year_counter': genre_year_counter,
+    }
+    years_json = json.dumps(years)
+
+    for name, df in datasets.items():
+        save_dataframe_to_disk(df, name, save_folder=save_folder, userid=userid)
+    save_data_to_disk(years_json, 'years.json', save_folder=save_folder, userid=userid)
+    version = save_dataset_version(datasets, save_folder=save_folder, userid=userid)
+
+    return {'version': version, 'years': years}
+
 
 def create_dash_app(server, google, dashboard_metadata):
     load_figure_template("flatly")
@@ -102,13 +443,14 @@ def create_dash_app(server, google, dashboard_metadata):
                                                         html.Button("Fetch Data", id="fetch-data-button", n_clicks=0,
                                                                     className="btn btn-info btn-lg",
                                                                     style={'width': '100%'}),
-                                                        dcc.Store(id='tracks-df'),
-                                                        dcc.Store(id='tracks-encoded-df'),
+                                                        dcc.Store(id='dataset-version'),
                                                         dcc.Store(id='years-list'),
-                                                        dcc.Store(id='artist-presence-df'),
-                                                        dcc.Store(id='genre-counter-df'),
                                                         dcc.Store(id='color-map'),
                                                     ]),
+                                        dbc.Progress(id='fetch-progress', value=0, striped=True, animated=True,
+                                                     className="mt-2", style={'display': 'none'}),
+                                        dcc.Store(id='fetch-job'),
+                                        dcc.Interval(id='fetch-job-interval', interval=1000, disabled=True),
                                     ]),
                                     className="mb-4"
                                 ),
@@ -164,15 +506,24 @@ def create_dash_app(server, google, dashboard_metadata):
     )
 
 
+    def get_user_datasets(version):
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        with measure_phase('pandas'):
+            datasets = get_dataset(save_folder, session['id'], version,
+                                   lambda: load_saved_datasets(save_folder=save_folder, userid=session['id']))
+        # The data was cleared, e.g. in another tab
+        if datasets is None:
+            raise dash.exceptions.PreventUpdate
+        return datasets
+
     @dash_app.callback(
-        dd.Output("tracks-df", "data"),
-        dd.Output("tracks-encoded-df", "data"),
-        dd.Output("artist-presence-df", "data"),
-        dd.Output("genre-counter-df", "data"),
+        dd.Output("dataset-version", "data"),
         dd.Output("years-list", "data"),
         dd.Output("song-occurance-flow-year", "options"),
         dd.Output("url", "href"),
         dd.Output("url", "refresh"),
+        dd.Output("fetch-job", "data"),
+        dd.Output("fetch-job-interval", "disabled"),
         dd.Input("fetch-data-button", "n_clicks"),
         dd.State("url", "href"),
     )
@@ -187,16 +538,18 @@ def create_dash_app(server, google, dashboard_metadata):
 
         save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
         if n_clicks == 0 and code is None:
-            files_to_check = ['tracks.json', 'tracks_encoded.json', 'artist_presence.json', 'genre_year_counter.json', 'years.json']
-            if check_if_saved_data_exists(files_to_check, save_folder=save_folder, userid=session['id']):
-                tracks = fetch_data_from_disk('tracks.json', save_folder=save_folder, userid=session['id'])
-                tracks_encoded = fetch_data_from_disk('tracks_encoded.json', save_folder=save_folder, userid=session['id'])
-                artist_presence = fetch_data_from_disk('artist_presence.json', save_folder=save_folder, userid=session['id'])
-                genre_year_counter = fetch_data_from_disk('genre_year_counter.json', save_folder=save_folder, userid=session['id'])
+            # Resume polling a fetch that is still running, e.g. after a page reload
+            job_id = get_active_job((save_folder, session['id']))
+            if job_id is not None:
+                return (dash.no_update,) * 5 + (job_id, False)
+
+            if check_if_saved_dataframes_exist(dataset_names, save_folder=save_folder, userid=session['id']) and \
+                    check_if_saved_data_exists(['years.json'], save_folder=save_folder, userid=session['id']):
+                version = fetch_dataset_version(save_folder=save_folder, userid=session['id'])
                 years_json = fetch_data_from_disk('years.json', save_folder=save_folder, userid=session['id'])
                 years = json.loads(years_json)
 
-                return (tracks, tracks_encoded, artist_presence, genre_year_counter, years_json, years,) + (dash.no_update, )*2
+                return (version, years_json, years,) + (dash.no_update, )*4
             else:
                 raise dash.exceptions.PreventUpdate
 
@@ -209,120 +562,44 @@ def create_dash_app(server, google, dashboard_metadata):
         if code is None and valid_token is None:
             # Redirect the user if the code is not present
             auth_url = auth_manager.get_authorize_url()
-            return (dash.no_update,) * 6 + (auth_url, True)
-
-        sp = spotipy.Spotify(auth_manager=auth_manager)
-        response = sp.current_user_playlists()
-
-        # Download and process "Your Top Songs" playlists
-        playlists = []
-        for item in response['items']:
-            if item['name'].startswith("Your Top Songs") and item['owner']['display_name'] == "Spotify":
-                playlists.append({
-                    "playlist_year": item["name"][-4:],
-                    "playlist_name": item["name"],
-                    "playlist_id": item["id"]
-                })
-
-        playlists = pd.DataFrame(playlists)
-        playlists = playlists.sort_values("playlist_year", ignore_index=True)
-
-        # Download and process tracks from the playlists
-        tracks = []
-        for idx, row in playlists.iterrows():
-            response = sp.playlist(row["playlist_id"])
-
-            for item in response['tracks']['items']:
-                tracks.append({
-                    "name": item['track']['name'],
-                    "artists": [i['name'] for i in item['track']['artists']],
-                    "album": item['track']['album']['name'],
-                    "release_year": item['track']['album']['release_date'][:4],
-                    "duration": item['track']['duration_ms'] / 1000,
-                    "track_id": item['track']['id'],
-                    "artist_id": [i['id'] for i in item['track']['artists']],
-                    "album_id": item['track']['album']['id'],
-                    "playlist_year": row["playlist_year"],
-                    "playlist_name": row["playlist_name"]
-                })
-
-        tracks = pd.DataFrame(tracks)
-        tracks['my_id'] = tracks['name'] + "--" + tracks['artists'].apply(', '.join) + "--" + tracks['album']
-
-        # Create tracks_encoded table
-        temp = tracks.groupby('my_id').playlist_year.apply(list).reset_index()
-        temp = temp.merge(tracks.drop(['playlist_year', 'playlist_name'], axis=1), on='my_id', how='left')
-
-        mlb = MultiLabelBinarizer()
-
-        tracks_encoded = pd.concat(
-            [temp, pd.DataFrame(mlb.fit_transform(temp['playlist_year']), columns=mlb.classes_, index=temp.index)],
-            axis=1)
-        tracks_encoded = tracks_encoded.drop_duplicates('my_id').reset_index(drop=True)
-        tracks_encoded = tracks_encoded.drop('playlist_year', axis=1)
-
-        years = list(mlb.classes_)
-
-        tracks_encoded["occurances"] = tracks_encoded[years].sum(axis=1)
-
-        # Create artist-occurance-graph
-        artists = list(set([j for i in tracks_encoded.artists.to_list() for j in i]))
-
-        artist_presence = []
-        for artist in artists:
-            temp = (
-                tracks_encoded.loc[tracks_encoded['artists'].apply(lambda x: artist in x), years]).sum().to_dict()
-            temp["artist"] = artist
-            artist_presence.append(temp)
-
-        artist_presence = pd.DataFrame(artist_presence)
-        artist_presence['occurances'] = artist_presence[years].sum(axis=1)
-        artist_presence = artist_presence.sort_values('occurances', ascending=False)
-
-        # Download and process genre
-        artist_ids = list(set([j for i in tracks_encoded.artist_id.to_list() for j in i]))
-
-        artist_genres = {}
-        for i in range(0, len(artist_ids), 50):
-            response = sp.artists(artist_ids[i:i + 50])
-            for item in response['artists']:
-                artist_genres[item['name']] = item['genres']
-
-        artist_presence['genres'] = artist_presence['artist'].map(artist_genres)
-
-        genre_year_counter = {year: [] for year in years}
-
-        for idx, row in artist_presence.iterrows():
-            for year in years:
-                genre_year_counter[year] = genre_year_counter[year] + (row['genres'] * row[year])
-
-        genre_year_counter = {k: Counter(v) for k, v in genre_year_counter.items()}
-
-        genre_total_counter = Counter()
-        for i in genre_year_counter.values():
-            genre_total_counter.update(i)
-
-        top_genres = [i[0] for i in genre_total_counter.most_common(5)]
-
-        genre_year_counter = pd.DataFrame(genre_year_counter)
-        genre_year_counter = genre_year_counter[genre_year_counter.index.isin(top_genres)]
-        genre_year_counter = genre_year_counter.fillna(0)
-        genre_year_counter = genre_year_counter.reindex(top_genres, fill_value=0).astype(int)
-        genre_year_counter = genre_year_counter.T
-
-        tracks = tracks.to_json(date_format='iso', orient='split')
-        tracks_encoded = tracks_encoded.to_json(date_format='iso', orient='split')
-        artist_presence = artist_presence.to_json(date_format='iso', orient='split')
-        genre_year_counter = genre_year_counter.to_json(date_format='iso', orient='split')
-        years_json = json.dumps(years)
-
-        save_data_to_disk(tracks, 'tracks.json', save_folder=save_folder, userid=session['id'])
-        save_data_to_disk(tracks_encoded, 'tracks_encoded.json', save_folder=save_folder, userid=session['id'])
-        save_data_to_disk(artist_presence, 'artist_presence.json', save_folder=save_folder, userid=session['id'])
-        save_data_to_disk(genre_year_counter, 'genre_year_counter.json', save_folder=save_folder, userid=session['id'])
-        save_data_to_disk(years_json, 'years.json', save_folder=save_folder, userid=session['id'])
+            return (dash.no_update,) * 3 + (auth_url, True) + (dash.no_update,) * 2
 
-        return (tracks, tracks_encoded, artist_presence, genre_year_counter, years_json, years) + (current_url, dash.no_update)
+        # Resolve the token here since the fetch threads have no access to the Flask session
+        sp = create_spotify_client(auth_manager.get_access_token(as_dict=False))
+        job_id = submit_job((save_folder, session['id']), fetch_top_100_data, sp, save_folder, session['id'])
+
+        return (dash.no_update,) * 3 + (current_url, dash.no_update, job_id, False)
+
+    @dash_app.callback(
+        dd.Output("dataset-version", "data", allow_duplicate=True),
+        dd.Output("years-list", "data", allow_duplicate=True),
+        dd.Output("song-occurance-flow-year", "options", allow_duplicate=True),
+        dd.Output("fetch-job-interval", "disabled", allow_duplicate=True),
+        dd.Output("fetch-progress", "value"),
+        dd.Output("fetch-progress", "label"),
+        dd.Output("fetch-progress", "style"),
+        dd.Input("fetch-job-interval", "n_intervals"),
+        dd.State("fetch-job", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_fetch_job(_, job_id):
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        job = get_job((save_folder, session['id']), job_id)
+        if job is None:
+            # Replaced by a newer fetch, e.g. from another tab, show whatever is saved now
+            if check_if_saved_dataframes_exist(dataset_names, save_folder=save_folder, userid=session['id']) and \
+                    check_if_saved_data_exists(['years.json'], save_folder=save_folder, userid=session['id']):
+                version = fetch_dataset_version(save_folder=save_folder, userid=session['id'])
+                years_json = fetch_data_from_disk('years.json', save_folder=save_folder, userid=session['id'])
+                return (version, years_json, json.loads(years_json)) + (True, 0, "", {'display': 'none'})
+            return (dash.no_update,) * 3 + (True, 0, "", {'display': 'none'})
+        if job['status'] == 'failed':
+            return (dash.no_update,) * 3 + (True, 100, "Fetching failed, please try again", {})
+        if job['status'] != 'done':
+            return (dash.no_update,) * 4 + (job['progress'], job['message'], {})
+
+        years = job['result']['years']
+        return (job['result']['version'], json.dumps(years), years) + (True, 100, "", {'display': 'none'})
 
     @dash_app.callback(
         dd.Output("song-length-graph", "figure"),
@@ -330,125 +607,53 @@ def create_dash_app(server, google, dashboard_metadata):
         dd.Output("top-genre-graph", "figure"),
         dd.Output("color-map", "data"),
         dd.Input("years-list", 'modified_timestamp'),  # Using only 1 ts since they should all be updated together
-        dd.State("tracks-df", "data"),
-        dd.State("artist-presence-df", "data"),
-        dd.State("genre-counter-df", "data"),
+        dd.State("dataset-version", "data"),
         dd.State("years-list", "data"),
     )
-    def create_graphs(ts, tracks, artist_presence, genre_year_counter, years):
+    def create_graphs(ts, version, years):
         if ts is None:
             raise dash.exceptions.PreventUpdate
 
-        tracks = pd.read_json(tracks, orient='split')
-        artist_presence = pd.read_json(artist_presence, orient='split')
-        genre_year_counter = pd.read_json(genre_year_counter, orient='split')
-        years = json.loads(years)
-
-        # Create song-length-graph
-        song_length_fig = px.violin(tracks, x="playlist_year", y="duration", color="playlist_year", box=True,
-                                    points="all", hover_data=['name', 'artists', 'album', 'duration'],
-                                    labels={
-                                        "playlist_year": "Year",
-                                        "duration": "Song Length (secs)",
-                                        "name": "Title",
-                                        "artists": "Artist(s)",
-                                        "album": "Album"
-                                    },
-                                    title="Song Length Across Years",
-                                    height=600)
-
-        # Set color map for consistency
-        color_map = {i['name']: i['marker']['color'] for i in song_length_fig['data']}
-
-        artist_occurance_fig = px.imshow(artist_presence[years].head(10).values.tolist(),
-                                         labels=dict(x="Year", y="Artist", color="Occurances"),
-                                         x=years,
-                                         y=artist_presence.artist.to_list()[:10],
-                                         height=800,
-                                         title="Presence Of Your Top 10 Artists")
-        artist_occurance_fig.update_xaxes(side="top")
-
-        top_genre_fig = go.Figure()
-
-        for idx, row in genre_year_counter.iterrows():
-            top_genre_fig.add_trace(go.Scatterpolar(
-                r=row,
-                theta=genre_year_counter.columns,
-                fill='toself',
-                name=idx
-            ))
-
-        top_genre_fig.update_layout(
-            polar=dict(
-                radialaxis=dict(
-                    visible=True
-                )),
-            height=800,
-            title='Presence Of Your Top 5 Genres')
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        payload_budget = dashboard_metadata.get('figure_payload_budget', SONG_LENGTH_PAYLOAD_BUDGET)
+        points_threshold = dashboard_metadata.get('figure_points_threshold', SONG_LENGTH_POINTS_THRESHOLD)
+        def create_graph_figures():
+            datasets = get_user_datasets(version)
+            with measure_phase('plotly'):
+                return create_figures(datasets, json.loads(years), payload_budget, points_threshold)
 
-        color_map = json.dumps(color_map)
-        return song_length_fig, artist_occurance_fig, top_genre_fig, color_map
+        return fetch_cached_figures(save_folder, session['id'], version, [], create_graph_figures)
 
     @dash_app.callback(
         dd.Output("song-occurance-flow-graph", "figure"),
         dd.Output("song-occurance-flow-table", "figure"),
         dd.Input("color-map", 'modified_timestamp'),  # Using only 1 ts since color-map should be last updated
         dd.Input("song-occurance-flow-year", "value"),
-        dd.State("tracks-encoded-df", "data"),
+        dd.State("dataset-version", "data"),
         dd.State("years-list", "data"),
         dd.State("color-map", "data"),
     )
-    def create_song_occurance_flow(ts, year_filter, tracks_encoded, years, color_map):
+    def create_song_occurance_flow(ts, year_filter, version, years, color_map):
         if ts is None:
             raise dash.exceptions.PreventUpdate
 
-        tracks_encoded = pd.read_json(tracks_encoded, orient='split')
         years = json.loads(years)
         color_map = json.loads(color_map)
 
         if year_filter is None:
             year_filter = years[-1]
 
-        dims = []
-        for year in years:
-            dims.append(go.parcats.Dimension(
-                values=tracks_encoded[year],
-                label=year, categoryarray=[1, 0],
-                ticktext=['Top 100 🕪', '🔇']
-            ))
+        # All years are built together on the first request, after that switching years is a cache lookup
+        def create_flow_figures():
+            tracks_encoded = get_user_datasets(version)['tracks_encoded']
+            with measure_phase('plotly'):
+                flow_figures = create_song_occurance_flows(tracks_encoded, years, color_map)
+            for year, figures in flow_figures.items():
+                put_cached_figures(save_folder, session['id'], version, [year], figures)
+            return flow_figures[year_filter]
 
-        # Create parcats trace
-        color = tracks_encoded[year_filter];
-        colorscale = [[0, 'lightsteelblue'], [1, color_map[year_filter]]]
-
-        g1 = go.Figure(data=[go.Parcats(dimensions=dims,
-                                        line={'color': color, 'colorscale': colorscale},
-                                        hoveron='color', hoverinfo='skip',
-                                        arrangement='freeform')],
-                       layout=go.Layout(title=f'{year_filter} Song Occurance Flow'))
-
-        temp = tracks_encoded[(tracks_encoded[year_filter] == 1) & (tracks_encoded['occurances'] > 1)]
-        temp = temp.sort_values(['occurances'] + years[::-1], ascending=False)
-        temp = temp[['name', 'artists', 'album'] + years]
-        temp['artists'] = temp['artists'].str.join(', ')
-
-        header_values = ['<b>Title</b>', '<b>Artist(s)</b>', '<b>Album</b>'] + [f'<b>{i}</b>' for i in years]
-        color_values = [["#EBF0F8"] * len(temp), ["#EBF0F8"] * len(temp), ["#EBF0F8"] * len(temp)] + [
-            ["#EBF0F8" if j == 0 else color_map[i] for j in temp[i]] for i in years]
-        temp[years] = temp[years].applymap({1: 'Top 100 🕪', 0: '🔇'}.get)
-        cell_values = [temp[i] for i in temp.columns]
-
-        g2 = go.Figure(data=[go.Table(
-            header=dict(
-                values=header_values,
-                line_color='white', fill_color='white',
-                align='center', font=dict(color='black', size=12)),
-            cells=dict(
-                values=cell_values,
-                fill_color=color_values))],
-            layout=go.Layout(height=1000, title=f'{year_filter} Songs Details'))
-
-        return g1, g2
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        return fetch_cached_figures(save_folder, session['id'], version, [year_filter], create_flow_figures)
 
     @dash_app.callback(
         dd.Output('url', 'href', allow_duplicate=True),
@@ -458,6 +663,7 @@ def create_dash_app(server, google, dashboard_metadata):
     def clear_data(_):
         save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
         clear_data_from_disk(save_folder=save_folder, userid=session['id'])
+        drop_dataset(save_folder=save_folder, userid=session['id'])
         return dashboard_metadata['url_base_pathname']
 
     @dash_app.callback(
@@ -467,9 +673,4 @@ def create_dash_app(server, google, dashboard_metadata):
     def update_email(_):
         return f"Logged in as {session.get('email', 'unknown')}"
 
-    @dash_app.server.before_request
-    def ensure_logged_in():
-        if request.path.startswith(dash_app.config['url_base_pathname'].rstrip('/')) and not google.authorized:
-            return redirect(url_for("welcome"))
-
     return dash_app
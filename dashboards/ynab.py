@@ -3,24 +3,292 @@ from dash import dcc, html
 import dash.dependencies as dd
 import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import load_figure_template
-import plotly.express as px
-import plotly.graph_objects as go
 import plotly.io as pio
 
-import base64
-import io
+import os
 from zipfile import ZipFile
 
-from flask import session, redirect, url_for, request
+from flask import session, redirect, request, render_template, current_app
 
 import pandas as pd
 
 from utils.utils import *
+from utils.store_util import *
+from utils.job_util import submit_job, get_job, get_active_job
+from utils.metrics_util import measure_phase
 
 # stylesheet with the .dbc class from dash-bootstrap-templates library
 dbc_css = "https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates/dbc.min.css"
 fa_css = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.3.0/css/all.min.css"
 
+dataset_names = ['register', 'budget']
+# Pre-aggregated at upload, the figures only ever read these
+cube_names = ['register_cube', 'budget_cube']
+
+# Defaults for the upload limits, overridable per dashboard in dashboards_config.json
+MAX_UPLOAD_BYTES = 100 * 2 ** 20
+MAX_MEMORY_BYTES = 1024 * 2 ** 20
+CSV_CHUNK_ROWS = 50000
+
+
+# Explicit dtypes so pandas skips type inference, low cardinality text is stored once per value as categories
+REGISTER_DTYPES = {'Account': 'category', 'Flag': 'category', 'Date': str, 'Payee': 'category',
+                   'Category Group/Category': 'category', 'Category Group': 'category', 'Category': 'category',
+                   'Memo': str, 'Outflow': str, 'Inflow': str, 'Cleared': 'category'}
+BUDGET_DTYPES = {'Month': str, 'Category Group/Category': 'category', 'Category Group': 'category',
+                 'Category': 'category', 'Budgeted': str, 'Activity': str, 'Available': str}
+REGISTER_CURRENCY_COLUMNS = ['Outflow', 'Inflow']
+BUDGET_CURRENCY_COLUMNS = ['Budgeted', 'Activity', 'Available']
+REGISTER_CUBE_COLUMNS = ['Account', 'Category Group', 'Category']
+# Resolutions of the time axis from finest to coarsest, as (name, adjective, period frequency, label format)
+RESOLUTIONS = [('Month', 'Monthly', 'M', '%b %Y'), ('Quarter', 'Quarterly', 'Q', 'Q%q %Y'), ('Year', 'Yearly', 'Y', '%Y')]
+# Longer date ranges switch to a coarser resolution, so a 10 year history plots as fast as a single year
+MAX_PLOTTED_PERIODS = 24
+# Months selected on the slider when the dashboard opens
+DEFAULT_RANGE_MONTHS = 12
+# Columns identifying a register row when merging exports, YNAB exports carry no transaction id
+REGISTER_KEY_COLUMNS = ['Date', 'Account', 'Payee', 'Outflow', 'Inflow', 'Memo']
+# Date formats YNAB exports depending on the user's settings, the first one matching every row wins
+REGISTER_DATE_FORMATS = ['%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%Y-%m-%d', '%d.%m.%Y', '%d-%m-%Y']
+
+
+def load_saved_datasets(save_folder, userid):
+    if check_if_saved_dataframes_exist(cube_names, save_folder=save_folder, userid=userid):
+        return {name: fetch_dataframe_from_disk(name, save_folder=save_folder, userid=userid) for name in cube_names}
+
+    # Exports saved before the cubes existed get them built once
+    datasets = {name: fetch_dataframe_from_disk(name, save_folder=save_folder, userid=userid) for name in dataset_names}
+    datasets = upgrade_legacy_datasets(datasets)
+    cubes = create_cubes(datasets['register'], datasets['budget'])
+    for name, df in cubes.items():
+        save_dataframe_to_disk(df, name, save_folder=save_folder, userid=userid)
+    return cubes
+
+
+def upgrade_legacy_datasets(datasets):
+    # Exports saved before the typed ingestion hold currency as float dollars and dates as text
+    register_df, budget_df = datasets['register'], datasets['budget']
+    if 'Month' not in register_df.columns:
+        for column in REGISTER_CURRENCY_COLUMNS:
+            register_df[column] = (register_df[column].fillna(0) * 100).round().astype('int64')
+        register_df['Date'] = pd.to_datetime(register_df['Date'])
+        register_df['Month'] = register_df['Date'].dt.to_period('M').dt.start_time
+        for column in [column for column, dtype in REGISTER_DTYPES.items() if dtype == 'category']:
+            register_df[column] = register_df[column].astype('category')
+    if budget_df['Month'].dtype == object:
+        for column in BUDGET_CURRENCY_COLUMNS:
+            budget_df[column] = (budget_df[column].fillna(0) * 100).round().astype('int64')
+        budget_df['Month'] = pd.to_datetime(budget_df['Month'], format='%b %Y')
+        for column in [column for column, dtype in BUDGET_DTYPES.items() if dtype == 'category']:
+            budget_df[column] = budget_df[column].astype('category')
+    return datasets
+
+
+def parse_currency_cents(values):
+    # Vectorized over the distinct strings only, amounts repeat a lot in a register.
+    # Handles any currency symbol or code, '-' or '(...)' negatives and both '1,234.56' and '1.234,56' styles
+    codes, uniques = pd.factorize(values.fillna(''))
+    uniques = pd.Series(uniques, dtype=object)
+    negative = uniques.str.contains(r'-|\(', regex=True)
+    # A separator followed by one or two digits at the end is the decimal one, anything else groups thousands
+    decimals = uniques.str.extract(r'[.,](\d{1,2})\D*$', expand=False).str.len().fillna(0).astype('int64')
+    digits = uniques.str.replace(r'\D+', '', regex=True).replace('', '0').astype('int64')
+    cents = digits * 10 ** (2 - decimals)
+    cents = cents.where(~negative, -cents).to_numpy()
+    return pd.Series(cents[codes] if len(cents) else codes.astype('int64'), index=values.index)
+
+
+def parse_register_dates(values):
+    # Parsing with a fixed format is much faster than letting pandas infer it for every row
+    for date_format in REGISTER_DATE_FORMATS:
+        dates = pd.to_datetime(values, format=date_format, errors='coerce')
+        if dates.notna().sum() == values.notna().sum():
+            return dates
+    return pd.to_datetime(values)
+
+
+def concat_frames(frames):
+    # Frames only know the categories they have seen, so unify them first to keep the columns categorical
+    for column in frames[0].select_dtypes('category').columns:
+        categories = pd.api.types.union_categoricals([frame[column].astype('category') for frame in frames],
+                                                     sort_categories=True).categories
+        frames = [frame.assign(**{column: frame[column].astype(pd.CategoricalDtype(categories))}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_csv_member(zip_file, member, max_memory_bytes, dtype=None):
+    # Reads the CSV in chunks straight from the zip member stream, giving up once it outgrows the memory ceiling
+    chunks = []
+    memory_bytes = 0
+    with zip_file.open(member) as f:
+        for chunk in pd.read_csv(f, chunksize=CSV_CHUNK_ROWS, dtype=dtype, encoding='utf-8-sig'):
+            memory_bytes += chunk.memory_usage(deep=True).sum()
+            if memory_bytes > max_memory_bytes:
+                raise MemoryError(f"{member.filename} needs more than {max_memory_bytes} bytes of memory")
+            chunks.append(chunk)
+    return concat_frames(chunks)
+
+
+def prepare_register(register_df):
+    for column in REGISTER_CURRENCY_COLUMNS:
+        register_df[column] = parse_currency_cents(register_df[column])
+    register_df['Date'] = parse_register_dates(register_df['Date'])
+    # Month key parsed once here instead of reformatting dates on every figure update
+    register_df['Month'] = register_df['Date'].dt.to_period('M').dt.start_time
+    return register_df
+
+
+def prepare_budget(budget_df):
+    for column in BUDGET_CURRENCY_COLUMNS:
+        budget_df[column] = parse_currency_cents(budget_df[column])
+    budget_df['Month'] = pd.to_datetime(budget_df['Month'], format='%b %Y')
+    return budget_df
+
+
+def create_cubes(register_df, budget_df):
+    # Month x account x category group x category totals, small enough to slice and sum on every interaction.
+    # Grouped on the category codes since groupby drops missing categories, e.g. the category of transfers
+    keys = [register_df['Month']] + [register_df[column].cat.codes.rename(column) for column in REGISTER_CUBE_COLUMNS]
+    register_cube = register_df.groupby(keys)[REGISTER_CURRENCY_COLUMNS].sum().reset_index()
+    for column in REGISTER_CUBE_COLUMNS:
+        register_cube[column] = pd.Categorical.from_codes(register_cube[column], dtype=register_df[column].dtype)
+
+    budget_cube = budget_df.groupby('Month')[BUDGET_CURRENCY_COLUMNS].sum().reset_index()
+    return {'register_cube': register_cube, 'budget_cube': budget_cube}
+
+
+def create_register_keys(register_df):
+    # Identical rows are legitimate (two coffees on the same day), so each repeat of a row gets its own key
+    row_hash = pd.util.hash_pandas_object(register_df[REGISTER_KEY_COLUMNS], index=False)
+    return pd.MultiIndex.from_arrays([row_hash.values, row_hash.groupby(row_hash.values).cumcount().values])
+
+
+def merge_ynab_export(saved, cubes, register_df, budget_df):
+    # The new export replaces the saved rows of the accounts it contains between its first and last transaction,
+    # everything else is kept as is. An export of one account or starting mid-month leaves the other rows alone
+    saved_register, saved_budget = saved['register'], saved['budget']
+    covered = saved_register['Date'].between(register_df['Date'].min(), register_df['Date'].max()) & \
+        saved_register['Account'].isin(register_df['Account'].unique())
+    saved_keys = create_register_keys(saved_register[covered])
+    new_keys = create_register_keys(register_df)
+
+    # A changed row shows up as one removed and one added row
+    removed = saved_register[covered][~saved_keys.isin(new_keys)]
+    added = register_df[~new_keys.isin(saved_keys)]
+    register_months = pd.concat([removed['Month'], added['Month']]).unique()
+    if len(register_months):
+        register_df = concat_frames([saved_register[~covered], register_df]).sort_values('Date', kind='stable', ignore_index=True)
+    else:
+        register_df = saved_register
+
+    budget_months = budget_df['Month'].unique()
+    budget_df = concat_frames([saved_budget[~saved_budget['Month'].isin(budget_months)], budget_df])
+    budget_df = budget_df.sort_values('Month', kind='stable', ignore_index=True)
+
+    # Aggregates are only recomputed for the months that changed
+    updated = create_cubes(register_df[register_df['Month'].isin(register_months)],
+                           budget_df[budget_df['Month'].isin(budget_months)])
+    register_cube = concat_frames([cubes['register_cube'][~cubes['register_cube']['Month'].isin(register_months)],
+                                   updated['register_cube']])
+    budget_cube = concat_frames([cubes['budget_cube'][~cubes['budget_cube']['Month'].isin(budget_months)],
+                                 updated['budget_cube']])
+    cubes = {'register_cube': register_cube.sort_values(['Month'] + REGISTER_CUBE_COLUMNS, ignore_index=True),
+             'budget_cube': budget_cube.sort_values('Month', ignore_index=True)}
+
+    changes = {'added': len(added), 'removed': len(removed), 'months': len(register_months)}
+    return register_df, budget_df, cubes, changes
+
+
+def ingest_ynab_export(report_progress, zip_path, save_folder, userid, max_memory_bytes=MAX_MEMORY_BYTES, merge=False):
+    report_progress(10, 'Reading the export')
+    try:
+        with ZipFile(zip_path) as zip_file:
+            members = {member.filename.split(' ')[-1]: member for member in zip_file.infolist()}
+            register_df = read_csv_member(zip_file, members['Register.csv'], max_memory_bytes, REGISTER_DTYPES)
+            budget_df = read_csv_member(zip_file, members['Budget.csv'], max_memory_bytes, BUDGET_DTYPES)
+    finally:
+        os.remove(zip_path)
+
+    # Currency values are kept as integer cents
+    report_progress(60, 'Processing transactions')
+    register_df = prepare_register(register_df)
+    budget_df = prepare_budget(budget_df)
+
+    if merge and check_if_saved_dataframes_exist(dataset_names, save_folder=save_folder, userid=userid):
+        report_progress(70, 'Merging with your saved data')
+        cubes = load_saved_datasets(save_folder=save_folder, userid=userid)
+        saved = {name: fetch_dataframe_from_disk(name, save_folder=save_folder, userid=userid) for name in dataset_names}
+        register_df, budget_df, cubes, changes = merge_ynab_export(upgrade_legacy_datasets(saved), cubes, register_df, budget_df)
+        current_app.logger.info(f"YNAB export merged: added={changes['added']}, removed={changes['removed']}, "
+                                f"months={changes['months']}")
+        # Nothing changed in the register, so only the budget needs rewriting
+        unchanged = ['register', 'register_cube'] if changes['months'] == 0 else []
+    else:
+        report_progress(80, 'Summarising transactions')
+        cubes = create_cubes(register_df, budget_df)
+        unchanged = []
+
+    report_progress(90, 'Saving your data')
+    datasets = {'register': register_df, 'budget': budget_df, **cubes}
+    for name, df in datasets.items():
+        if name not in unchanged:
+            save_dataframe_to_disk(df, name, save_folder=save_folder, userid=userid)
+
+    return save_dataset_version(cubes, save_folder=save_folder, userid=userid)
+
+
+def create_cube_payload(datasets):
+    # Compact column arrays sent to the browser once per dataset version, assets/ynab.js rebuilds
+    # the figures from them whenever the date range or the selected accounts change
+    register_cube = datasets['register_cube']
+    budget_cube = datasets['budget_cube']
+
+    months = pd.PeriodIndex(budget_cube['Month'], freq='M')
+    register_cube = register_cube[register_cube['Month'].isin(budget_cube['Month'])]
+
+    template = pio.templates['flatly']
+    color_list = [template.layout.colorway[i] for i in range(5)]
+
+    return {
+        'months': months.strftime('%b %Y').tolist(),
+        'accounts': register_cube['Account'].cat.categories.tolist(),
+        'groups': register_cube['Category Group'].cat.categories.tolist(),
+        'categories': register_cube['Category'].cat.categories.tolist(),
+        'resolutions': [create_rollup(register_cube, months, *resolution) for resolution in RESOLUTIONS],
+        'max_periods': MAX_PLOTTED_PERIODS,
+        'template': template.to_plotly_json(),
+        'colors': color_list,
+        'light_colors': [hex_to_rgba(color, 0.6) for color in color_list],
+    }
+
+
+def create_rollup(register_cube, months, name, adjective, freq, label_format):
+    month_periods = months.asfreq(freq)
+    periods = month_periods.unique()
+    period_encoder = pd.Series(range(len(periods)), index=periods)
+
+    period = register_cube['Month'].dt.to_period(freq).map(period_encoder).rename('Period')
+    keys = [period] + [register_cube[column].cat.codes.rename(column) for column in REGISTER_CUBE_COLUMNS]
+    rollup = register_cube.groupby(keys)[REGISTER_CURRENCY_COLUMNS].sum().reset_index()
+
+    return {
+        'name': name,
+        'adjective': adjective,
+        'periods': periods.strftime(label_format).tolist(),
+        # Slider positions are months, mapped to the period they fall in
+        'month_period': period_encoder[month_periods].tolist(),
+        'period_months': month_periods.value_counts().reindex(periods).tolist(),
+        # Codes index into the lists of the payload, -1 is a missing category
+        'rows': {
+            'period': rollup['Period'].tolist(),
+            'account': rollup['Account'].tolist(),
+            'group': rollup['Category Group'].tolist(),
+            'category': rollup['Category'].tolist(),
+            'inflow': rollup['Inflow'].tolist(),
+            'outflow': rollup['Outflow'].tolist(),
+        },
+    }
+
 
 def create_dash_app(server, google, dashboard_metadata):
     load_figure_template("flatly")
@@ -96,21 +364,15 @@ def create_dash_app(server, google, dashboard_metadata):
                                          html.A("YNAB (You Need A Budget)", href="https://app.ynab.com/", target="_blank"),
                                          " page and upload the .zip file",
                                          html.Hr(),
-                                         dcc.Upload(
-                                             id='upload-data',
-                                             children=html.Div(['Drag and Drop or ', html.B('Select File')]),
-                                             style={
-                                                 'width': '100%',
-                                                 'height': '60px',
-                                                 'lineHeight': '60px',
-                                                 'borderWidth': '1px',
-                                                 'borderStyle': 'dashed',
-                                                 'borderRadius': '5px',
-                                                 'textAlign': 'center',
-                                                 "background-color": "#f8f9fa"
-                                             },
-                                             multiple=False,
-                                         )],
+                                         # The upload page posts the file to a route that streams it to disk
+                                         # instead of sending it base64 encoded through a callback
+                                         html.A("Upload Export", href=f"{dashboard_metadata['url_base_pathname']}upload",
+                                                className="btn btn-info btn-lg", style={'width': '100%'}),
+                                         dbc.Progress(id='upload-progress', value=0, striped=True, animated=True,
+                                                      className="mt-2", style={'display': 'none'}),
+                                         dcc.Store(id='upload-job'),
+                                         dcc.Interval(id='upload-job-interval', interval=1000, disabled=True),
+                                         ],
                                     ),
                                     className="mb-4"
                                 ),
@@ -168,8 +430,8 @@ def create_dash_app(server, google, dashboard_metadata):
                 ),
                 footer,
                 dcc.Location(id='url'),
-                dcc.Store(id='register-df'),
-                dcc.Store(id='budget-df'),
+                dcc.Store(id='dataset-version'),
+                dcc.Store(id='cube-payload'),
             ],
             className="dbc",
         ),
@@ -177,159 +439,138 @@ def create_dash_app(server, google, dashboard_metadata):
         style={"margin": 0, "padding": 0, "width": "100%", "max-width": "100%", "overflow-x": "hidden"},
     )
 
+    def get_user_datasets(version):
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        with measure_phase('pandas'):
+            datasets = get_dataset(save_folder, session['id'], version,
+                                   lambda: load_saved_datasets(save_folder=save_folder, userid=session['id']))
+        # The data was cleared, e.g. in another tab
+        if datasets is None:
+            raise dash.exceptions.PreventUpdate
+        return datasets
+
     @dash_app.callback(
-        dd.Output("register-df", "data"),
-        dd.Output("budget-df", "data"),
-        dd.Input('upload-data', 'contents'),
-        dd.State('upload-data', 'filename')
+        dd.Output("dataset-version", "data"),
+        dd.Output("upload-job", "data"),
+        dd.Output("upload-job-interval", "disabled"),
+        dd.Input("url", "pathname"),
     )
-    def fetch_data(content, filename):
+    def fetch_data(_):
         save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
-        if content is None:
-            files_to_check = ['register.json', 'budget.json']
-            if check_if_saved_data_exists(files_to_check, save_folder=save_folder, userid=session['id']):
-                register_df = fetch_data_from_disk('register.json', save_folder=save_folder, userid=session['id'])
-                budget_df = fetch_data_from_disk('budget.json', save_folder=save_folder, userid=session['id'])
-
-                return register_df, budget_df
-            else:
-                raise dash.exceptions.PreventUpdate
-
-        content_type, content_string = content.split(',')
-        content_decoded = base64.b64decode(content_string)
-        zip_file = ZipFile(io.BytesIO(content_decoded))
-
-        dfs = {text_file.filename.split(' ')[-1]: pd.read_csv(zip_file.open(text_file.filename))
-               for text_file in zip_file.infolist() if text_file.filename.endswith('.csv')}
-
-        register_df = dfs['Register.csv']
-        budget_df = dfs['Budget.csv']
-
-        # Convert currency values to float
-        register_df['Inflow'] = register_df['Inflow'].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
-        register_df['Outflow'] = register_df['Outflow'].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
-        budget_df['Budgeted'] = budget_df['Budgeted'].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
-        budget_df['Activity'] = budget_df['Activity'].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
-        budget_df['Available'] = budget_df['Available'].str.replace(r'[^0-9.-]+', '', regex=True).astype(float)
+        # Poll the upload that is still being processed, it was submitted by the upload route before redirecting here
+        job_id = get_active_job((save_folder, session['id']))
+        if job_id is not None:
+            return dash.no_update, job_id, False
+
+        if check_if_saved_dataframes_exist(dataset_names, save_folder=save_folder, userid=session['id']):
+            return fetch_dataset_version(save_folder=save_folder, userid=session['id']), dash.no_update, dash.no_update
+        else:
+            raise dash.exceptions.PreventUpdate
 
-        register_df = register_df.to_json(date_format='iso', orient='split')
-        budget_df = budget_df.to_json(date_format='iso', orient='split')
+    @server.route(f"{dashboard_metadata['url_base_pathname']}upload", methods=["GET", "POST"])
+    def upload_export():
+        if request.method == "GET":
+            return render_template("upload.html", dashboard=dashboard_metadata)
 
-        save_data_to_disk(register_df, 'register.json', save_folder=save_folder, userid=session['id'])
-        save_data_to_disk(budget_df, 'budget.json', save_folder=save_folder, userid=session['id'])
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        max_upload_bytes = dashboard_metadata.get('max_upload_bytes', MAX_UPLOAD_BYTES)
+        # Checked before the body is read so oversized uploads are never written anywhere
+        if request.content_length is None or request.content_length > max_upload_bytes:
+            error = f"The export is larger than the {max_upload_bytes // 2 ** 20} MB limit"
+            return render_template("upload.html", dashboard=dashboard_metadata, error=error), 413
+
+        upload = request.files.get('file')
+        if upload is None or not upload.filename.endswith('.zip'):
+            return render_template("upload.html", dashboard=dashboard_metadata, error="Please select a .zip file"), 400
+
+        # A previous upload is still being processed, the dashboard keeps polling that one
+        if get_active_job((save_folder, session['id'])) is not None:
+            return redirect(dashboard_metadata['url_base_pathname'])
+
+        zip_path = save_stream_to_disk(upload.stream, 'upload.zip', save_folder=save_folder, userid=session['id'])
+        max_memory_bytes = dashboard_metadata.get('max_memory_bytes', MAX_MEMORY_BYTES)
+        merge = request.form.get('mode') == 'merge'
+        submit_job((save_folder, session['id']), ingest_ynab_export, zip_path, save_folder, session['id'], max_memory_bytes, merge)
+        return redirect(dashboard_metadata['url_base_pathname'])
 
-        return register_df, budget_df
+    @dash_app.callback(
+        dd.Output("dataset-version", "data", allow_duplicate=True),
+        dd.Output("upload-job-interval", "disabled", allow_duplicate=True),
+        dd.Output("upload-progress", "value"),
+        dd.Output("upload-progress", "label"),
+        dd.Output("upload-progress", "style"),
+        dd.Input("upload-job-interval", "n_intervals"),
+        dd.State("upload-job", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_upload_job(_, job_id):
+        save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
+        job = get_job((save_folder, session['id']), job_id)
+        if job is None:
+            # Replaced by a newer upload, e.g. from another tab, show whatever is saved now
+            if check_if_saved_dataframes_exist(dataset_names, save_folder=save_folder, userid=session['id']):
+                return fetch_dataset_version(save_folder=save_folder, userid=session['id']), True, 0, "", {'display': 'none'}
+            return dash.no_update, True, 0, "", {'display': 'none'}
+        if job['status'] == 'failed':
+            return dash.no_update, True, 100, "Processing failed, please check the export and try again", {}
+        if job['status'] != 'done':
+            return dash.no_update, dash.no_update, job['progress'], job['message'], {}
+
+        return job['result'], True, 100, "", {'display': 'none'}
 
     @dash_app.callback(
         dd.Output("date-range-slider", "marks"),
         dd.Output("date-range-slider", "min"),
         dd.Output("date-range-slider", "max"),
         dd.Output("date-range-slider", "value"),
-        dd.Input("budget-df", "modified_timestamp"),
-        dd.State("budget-df", "data"),
+        dd.Input("dataset-version", "data"),
     )
-    def create_daterange(ts, budget_df):
-        if budget_df is None:
+    def create_daterange(version):
+        if version is None:
             raise dash.exceptions.PreventUpdate
-        budget_df = pd.read_json(budget_df, orient='split')
+        budget_cube = get_user_datasets(version)['budget_cube']
 
-        date_range_decoder = {idx: month for idx, month in enumerate(budget_df['Month'].unique()[-12:])}
-        date_range_value = [0, len(date_range_decoder) - 1]
-        return date_range_decoder, date_range_value[0], date_range_value[1],date_range_value
+        # The slider covers the whole history, with marks thinned out to about a dozen labels
+        months = budget_cube['Month'].dt.strftime('%b %Y')
+        mark_step = -(-len(months) // 12)
+        date_range_decoder = {idx: month for idx, month in enumerate(months) if idx % mark_step == 0 or idx == len(months) - 1}
+        date_range_value = [max(len(months) - DEFAULT_RANGE_MONTHS, 0), len(months) - 1]
+        return date_range_decoder, 0, len(months) - 1, date_range_value
 
     @dash_app.callback(
         dd.Output("account-selector-checklist", "options"),
         dd.Output("account-selector-checklist", "value"),
-        dd.Input("register-df", "modified_timestamp"),
-        dd.State("register-df", "data"),
+        dd.Input("dataset-version", "data"),
     )
-    def create_acc_checklist(ts, register_df):
-        if register_df is None:
+    def create_acc_checklist(version):
+        if version is None:
             raise dash.exceptions.PreventUpdate
-        register_df = pd.read_json(register_df, orient='split')
+        register_cube = get_user_datasets(version)['register_cube']
 
-        accounts_list = list(register_df['Account'].unique())
+        accounts_list = list(register_cube['Account'].unique())
         return accounts_list, accounts_list
 
     @dash_app.callback(
+        dd.Output("cube-payload", "data"),
+        dd.Input("dataset-version", "data"),
+    )
+    def create_graphs_payload(version):
+        if version is None:
+            raise dash.exceptions.PreventUpdate
+        datasets = get_user_datasets(version)
+        with measure_phase('pandas'):
+            return create_cube_payload(datasets)
+
+    # Filtering runs in the browser, see assets/ynab.js
+    dash_app.clientside_callback(
+        dash.ClientsideFunction(namespace='ynab', function_name='create_graphs'),
         dd.Output("income-expense-graph", "figure"),
         dd.Output("expense-category-graph", "figure"),
         dd.Output("account-balance-graph", "figure"),
-        dd.Input("budget-df", "modified_timestamp"),
+        dd.Input("cube-payload", "data"),
         dd.Input("date-range-slider", "value"),
         dd.Input("account-selector-checklist", "value"),
-        dd.State("register-df", "data"),
-        dd.State("budget-df", "data"),
     )
-    def create_graphs(ts, date_range_value, accounts_list, register_df, budget_df):
-        if budget_df is None:
-            raise dash.exceptions.PreventUpdate
-        register_df = pd.read_json(register_df, orient='split')
-        budget_df = pd.read_json(budget_df, orient='split')
-
-        date_range_decoder = {idx: month for idx, month in enumerate(budget_df['Month'].unique()[-12:])}
-        date_range_encoder = {month: idx for idx, month in date_range_decoder.items()}
-        date_range_min, date_range_max = date_range_value[0], date_range_value[1]
-
-        # Data transformations
-        budget_df['date_range_encoded'] = budget_df['Month'].map(date_range_encoder)
-        register_df['date_range_encoded'] = pd.to_datetime(register_df['Date']).dt.strftime('%b %Y').map(date_range_encoder)
-        register_df = register_df[register_df['Account'].isin(accounts_list)]
-
-        monthly_data = register_df.groupby(['date_range_encoded']).sum(numeric_only=True).reset_index()
-        monthly_budget_activity = budget_df.groupby(['date_range_encoded', 'Month']).sum(numeric_only=True).reset_index()
-        monthly_data = pd.merge(monthly_data, monthly_budget_activity, left_on='date_range_encoded', right_on='date_range_encoded')
-        monthly_data['Savings'] = (monthly_data['Inflow'] - monthly_data['Outflow']).cumsum()
-        monthly_data['3-Month Inflow Avg'] = monthly_data['Inflow'].rolling(window=3, min_periods=1).mean()
-        monthly_data['3-Month Outflow Avg'] = monthly_data['Outflow'].rolling(window=3, min_periods=1).mean()
-
-        register_df['Balance'] = register_df['Inflow'] - register_df['Outflow']
-        register_df['Month'] = register_df['date_range_encoded'].map(date_range_decoder)
-        monthly_account_balance = register_df.groupby(['date_range_encoded', 'Month', 'Account'])['Balance'].sum().reset_index()
-        monthly_account_balance['Balance'] = monthly_account_balance.groupby('Account')['Balance'].transform(pd.Series.cumsum)
-
-        # Applying date range filter (Can't apply before finding MA)
-        monthly_data = monthly_data[(monthly_data['date_range_encoded'] >= date_range_min) & (monthly_data['date_range_encoded'] <= date_range_max)]
-        monthly_account_balance = monthly_account_balance[(monthly_account_balance['date_range_encoded'] >= date_range_min) & (monthly_account_balance['date_range_encoded'] <= date_range_max)]
-        budget_df = budget_df[(budget_df['date_range_encoded'] >= date_range_min) & (budget_df['date_range_encoded'] <= date_range_max)]
-        register_df = register_df[(register_df['date_range_encoded'] >= date_range_min) & (register_df['date_range_encoded'] <= date_range_max)]
-
-        total_income = register_df['Inflow'].sum()
-        total_expense = register_df['Outflow'].sum()
-        unspent_money = total_income - total_expense
-        outflow_by_category = register_df.groupby(['Category Group', 'Category']).sum(numeric_only=True).reset_index()[['Category Group', 'Category', 'Outflow']]
-        unspent_row = pd.DataFrame({'Category Group': ['Unspent'], 'Category': ['Unspent'], 'Outflow': [unspent_money]})
-        outflow_by_category = pd.concat([outflow_by_category, unspent_row], ignore_index=True)
-        outflow_by_category = outflow_by_category[outflow_by_category['Category Group'] != 'Inflow']
-        outflow_by_category['Avg. Outflow'] = (outflow_by_category['Outflow']/(date_range_max - date_range_min + 1)).round(2)
-
-        # Creating colors
-        template = pio.templates['flatly']
-        color_list = [template.layout.colorway[i] for i in range(5)]
-        color_light_list = [hex_to_rgba(color, 0.6) for color in color_list]
-
-        # Creating income-expense-graph
-        income_expense_fig = go.Figure()
-
-        income_expense_fig.add_trace(go.Bar(x=monthly_data['Month'], y=monthly_data['Inflow'], name='Income', marker_color=color_list[0]))
-        income_expense_fig.add_trace(go.Bar(x=monthly_data['Month'], y=monthly_data['Outflow'], name='Expenses', marker_color=color_list[1]))
-        income_expense_fig.add_trace(go.Scatter(x=monthly_data['Month'], y=monthly_data['3-Month Inflow Avg'], name='3-Month Income Avg', line=dict(dash='dash'), marker_color=color_light_list[0]))
-        income_expense_fig.add_trace(go.Scatter(x=monthly_data['Month'], y=monthly_data['3-Month Outflow Avg'], name='3-Month Expenses Avg', line=dict(dash='dash'), marker_color=color_light_list[1]))
-        income_expense_fig.add_trace(go.Scatter(x=monthly_data['Month'], y=monthly_data['Savings'], name='Savings', mode='lines+markers', marker_color=color_light_list[2]))
-        income_expense_fig.update_layout(title='Monthly Income, Expenses, and Savings', barmode='group')
-
-        # Creating expense-category-graph
-        expense_category_fig = px.sunburst(outflow_by_category, path=['Category Group', 'Category'], values='Outflow', custom_data=['Avg. Outflow'])
-        expense_category_fig.update_traces(textinfo="label+percent entry")
-        expense_category_fig.update_traces(hovertemplate='<b>%{label}</b><br>Amount: $%{value}<br>Monthly Avg.: $%{customdata[0]}<br>')
-        expense_category_fig.update_layout(title='Expenses by Category Group and Category')
-
-        # Creating account-balance-graph
-        account_balance_fig = px.bar(monthly_account_balance, x='Month', y='Balance', color='Account', text='Balance', barmode="group")
-        account_balance_fig.update_traces(texttemplate='%{text:.2s}', textposition='inside')
-        account_balance_fig.update_layout(title='Monthly Closing Balance by Account', yaxis_title='Account Balance')
-
-        return income_expense_fig, expense_category_fig, account_balance_fig
 
     @dash_app.callback(
         dd.Output('url', 'href'),
@@ -339,6 +580,7 @@ def create_dash_app(server, google, dashboard_metadata):
     def clear_data(_):
         save_folder = [storage['name'] for storage in dashboard_metadata["storage"] if storage['type'] == 'folder'][0]
         clear_data_from_disk(save_folder=save_folder, userid=session['id'])
+        drop_dataset(save_folder=save_folder, userid=session['id'])
         return dashboard_metadata['url_base_pathname']
 
     @dash_app.callback(
@@ -348,9 +590,4 @@ def create_dash_app(server, google, dashboard_metadata):
     def update_email(_):
         return f"Logged in as {session.get('email', 'unknown')}"
 
-    @dash_app.server.before_request
-    def ensure_logged_in():
-        if request.path.startswith(dash_app.config['url_base_pathname'].rstrip('/')) and not google.authorized:
-            return redirect(url_for("welcome"))
-
     return dash_app
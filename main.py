@@ -1,109 +1,172 @@
 import os
 import json
 import importlib
-from flask import Flask, redirect, url_for, render_template, session, request, send_from_directory
+import functools
+from flask import Flask, redirect, url_for, render_template, session, request, send_from_directory, abort
 from flask_dance.contrib.google import make_google_blueprint, google
 from oauthlib.oauth2.rfc6749.errors import InvalidClientIdError
 from utils.db_util import init_db, db
-import logging
-import traceback
-
-
-# Flask app + Google OAuth setup
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY")
-app.config["GOOGLE_OAUTH_CLIENT_ID"] = os.environ.get("GOOGLE_OAUTH_CLIENT_ID")
-app.config["GOOGLE_OAUTH_CLIENT_SECRET"] = os.environ.get("GOOGLE_OAUTH_CLIENT_SECRET")
-
-google_bp = make_google_blueprint(
-    client_id=app.config["GOOGLE_OAUTH_CLIENT_ID"],
-    client_secret=app.config["GOOGLE_OAUTH_CLIENT_SECRET"],
-    scope=["profile", "email"],
-    offline=True,
-)
-app.register_blueprint(google_bp, url_prefix="/login")
-
-# Configure Flask's built-in logger
-app.logger.setLevel(logging.INFO)
-handler = logging.FileHandler("user.log")
-handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
-app.logger.addHandler(handler)
-
-# Initialize the database
-init_db(app)
-
-# Create the database tables
-with app.app_context():
-    db.create_all()
-
-# Read the list of dashboards from the JSON file
-with open("dashboards_config.json", "r") as f:
-    dashboards_data = json.load(f)
-    dashboard_data_list = dashboards_data["dashboards"]
-
-# Dynamically import and create Dash apps for all dashboards
-for dashboard_metadata in dashboard_data_list:
-    dashboard_file = dashboard_metadata["file"]
-    dashboard_module = importlib.import_module(f"dashboards.{dashboard_file}")
-    create_dash_app = getattr(dashboard_module, "create_dash_app")
-    create_dash_app(app, google, dashboard_metadata)
-
-
-@app.route('/favicon.ico')
-def favicon():
-    return send_from_directory(os.path.join(app.root_path, 'assets'),
-                               'favicon.ico', mimetype='image/vnd.microsoft.icon')
-
-# Create Home Page (requires login)
-@app.route("/")
-def index():
-    if not google.authorized:
+from utils.dispatch_util import DashboardDispatcher
+from utils.auth_util import init_auth_gate
+from utils.log_util import init_logging, init_request_logging
+from utils.callback_util import wrap_callbacks
+from utils.metrics_util import init_metrics, instrument_callback, render_metrics
+from utils.profile_util import PROFILE_HEADER, profile_callback, list_profiles, is_profile_admin
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Overridable through create_app(config)
+DEFAULT_CONFIG = {
+    "DASHBOARDS_CONFIG": os.path.join(APP_ROOT, "dashboards_config.json"),
+    "LOG_FILE": "user.log",
+    # The log file is rotated when it reaches LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files.
+    # Forked workers (gunicorn) each write and rotate a file of their own, e.g. user.<pid>.log
+    "LOG_MAX_BYTES": 10 * 1024 * 1024,
+    "LOG_BACKUP_COUNT": 5,
+    # With several workers, each worker writes its callback metrics here so /metrics can add them up
+    "METRICS_DIR": os.environ.get("METRICS_DIR"),
+    # Profile every Dash callback with cProfile and tracemalloc, single requests can ask for it with a header instead
+    "PROFILE_CALLBACKS": os.environ.get("PROFILE_CALLBACKS") == "1",
+    "PROFILE_DIR": "profiles",
+    # Google ids allowed to profile with the header and to see the profiles, comma separated
+    "PROFILE_ADMINS": frozenset(filter(None, os.environ.get("PROFILE_ADMINS", "").replace(" ", "").split(","))),
+    # 'lazy' loads a dashboard on its first request, 'warm_up' loads them in a background thread after boot and
+    # 'eager' before create_app returns. Use 'eager' with gunicorn --preload so the heavy imports happen once
+    # in the master and are shared with the workers, e.g. DASHBOARD_LOADING=eager gunicorn --preload "main:create_app()"
+    "DASHBOARD_LOADING": os.environ.get("DASHBOARD_LOADING", "warm_up"),
+}
+
+
+def create_app(config=None):
+    # Flask app + Google OAuth setup
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+    app.config["GOOGLE_OAUTH_CLIENT_ID"] = os.environ.get("GOOGLE_OAUTH_CLIENT_ID")
+    app.config["GOOGLE_OAUTH_CLIENT_SECRET"] = os.environ.get("GOOGLE_OAUTH_CLIENT_SECRET")
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+
+    google_bp = make_google_blueprint(
+        client_id=app.config["GOOGLE_OAUTH_CLIENT_ID"],
+        client_secret=app.config["GOOGLE_OAUTH_CLIENT_SECRET"],
+        scope=["profile", "email"],
+        offline=True,
+    )
+    app.register_blueprint(google_bp, url_prefix="/login")
+
+    init_logging(app)
+    init_metrics(app)
+
+    # Initialize the database
+    init_db(app)
+
+    # Create the database tables
+    with app.app_context():
+        db.create_all()
+
+    # Read the list of dashboards from the JSON file
+    with open(app.config["DASHBOARDS_CONFIG"], "r") as f:
+        dashboards_data = json.load(f)
+        dashboard_data_list = dashboards_data["dashboards"]
+
+    # The home page, the profiles and every dashboard require a login
+    dashboard_segments = [dashboard_metadata["url_base_pathname"].strip("/") for dashboard_metadata in dashboard_data_list]
+    protected_segments = ["", "profiles"] + dashboard_segments
+    init_request_logging(app)
+    init_auth_gate(app, protected_segments)
+
+    # Dynamically import and create the Dash app of a dashboard on a server of its own, sharing the session,
+    # Google login, database and error pages of the main app
+    def create_dashboard_server(dashboard_metadata):
+        dashboard_server = Flask(__name__)
+        dashboard_server.config.update(app.config)
+        dashboard_server.register_blueprint(google_bp, url_prefix="/login")
+        init_request_logging(dashboard_server)
+        init_auth_gate(dashboard_server, protected_segments)
+        init_db(dashboard_server)
+        for code_or_exception, handler in [(404, page_not_found), (Exception, handle_exception),
+                                           (InvalidClientIdError, handle_invalid_google_login)]:
+            dashboard_server.register_error_handler(code_or_exception, handler)
+
+        dashboard_file = dashboard_metadata["file"]
+        dashboard_module = importlib.import_module(f"dashboards.{dashboard_file}")
+        create_dash_app = getattr(dashboard_module, "create_dash_app")
+        dash_app = create_dash_app(dashboard_server, google, dashboard_metadata)
+        dashboard = dashboard_metadata["url_base_pathname"].strip("/")
+        wrap_callbacks(dash_app, functools.partial(instrument_callback, dashboard=dashboard))
+        wrap_callbacks(dash_app, functools.partial(profile_callback, dashboard=dashboard))
+        app.logger.info(f"Dashboard loaded: {dashboard_file}")
+        return dashboard_server
+
+    @app.route('/favicon.ico')
+    def favicon():
+        return send_from_directory(os.path.join(app.root_path, 'assets'),
+                                   'favicon.ico', mimetype='image/vnd.microsoft.icon')
+
+    # Create Home Page (requires login, the auth gate has loaded the user's identity)
+    @app.route("/")
+    def index():
+        return render_template("index.html", given_name=session['given_name'], dashboards=dashboard_data_list)
+
+    # Callback metrics in Prometheus format, for the scraper, no login
+    @app.route("/metrics")
+    def metrics():
+        return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    # Recent callback profiles (requires login, only shown to the profile admins)
+    @app.route("/profiles")
+    def profiles():
+        if not is_profile_admin():
+            abort(404)
+        return render_template("profiles.html", profiles=list_profiles(app.config["PROFILE_DIR"]),
+                               header=PROFILE_HEADER, enabled=app.config["PROFILE_CALLBACKS"])
+
+    @app.route("/profiles/<path:filename>")
+    def profile_file(filename):
+        if not is_profile_admin():
+            abort(404)
+        mimetype = "text/plain" if filename.endswith(".txt") else "application/octet-stream"
+        return send_from_directory(os.path.abspath(app.config["PROFILE_DIR"]), filename, mimetype=mimetype)
+
+    # Create Welcome Page (prompts login)
+    @app.route("/welcome")
+    def welcome():
+        return render_template("welcome.html")
+
+    # Create Logout Page
+    @app.route("/logout")
+    def logout():
+        app.logger.info(f"User logged out: email={session['email']}, name={session['given_name']}")
+        session.clear()
         return redirect(url_for("welcome"))
 
-    resp = google.get("/oauth2/v1/userinfo")
-    assert resp.ok, resp.text
-    user_info = resp.json()
-    session['id'] = user_info['id']
-    session['email'] = user_info['email']
-    session['given_name'] = user_info['given_name']
+    # Error Handlers
+    @app.errorhandler(404)
+    def page_not_found(e):
+        app.logger.error(f"Error 404: {e}")
+        return render_template("error-404.html"), 404
 
-    app.logger.info(f"User logged in: email={session['email']}, name={session['given_name']}")
-    return render_template("index.html", given_name=user_info['given_name'], dashboards=dashboard_data_list)
+    @app.errorhandler(Exception)
+    def handle_exception(e):
+        app.logger.error(f"Error 500: {e}", exc_info=e)
+        return render_template("error.html"), 500
 
+    @app.errorhandler(InvalidClientIdError)
+    def handle_invalid_google_login(e):
+        session.clear()
+        # Also handles errors of the dashboard servers, which can't build URLs of the main app
+        return redirect("/welcome")
 
-# Create Welcome Page (prompts login)
-@app.route("/welcome")
-def welcome():
-    return render_template("welcome.html")
+    # Dashboard URLs are reserved here, their modules are only imported when loaded
+    dispatcher = DashboardDispatcher(app.wsgi_app, dashboard_data_list, create_dashboard_server)
+    app.wsgi_app = dispatcher
+    if app.config["DASHBOARD_LOADING"] == "eager":
+        dispatcher.load_all()
+    elif app.config["DASHBOARD_LOADING"] == "warm_up":
+        dispatcher.warm_up()
 
-
-# Create Logout Page
-@app.route("/logout")
-def logout():
-    app.logger.info(f"User logged out: email={session['email']}, name={session['given_name']}")
-    session.clear()
-    return redirect(url_for("welcome"))
-
-
-# Error Handlers
-@app.errorhandler(404)
-def page_not_found(e):
-    app.logger.error(f"Error 404: {e}")
-    return render_template("error-404.html"), 404
-
-
-@app.errorhandler(Exception)
-def handle_exception(e):
-    app.logger.error(f"Error 500: {e}")
-    app.logger.error(traceback.format_exc())
-    return render_template("error.html"), 500
-
-
-@app.errorhandler(InvalidClientIdError)
-def handle_invalid_google_login(e):
-    session.clear()
-    return redirect(url_for("welcome"))
+    return app
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
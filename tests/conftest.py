@@ -0,0 +1,28 @@
+import time
+
+import pytest
+
+import main
+from utils.auth_util import fingerprint_token
+
+# A logged-in user as left in the session by the Google login and the auth gate
+SESSION = {'google_oauth_token': {'access_token': 'test', 'token_type': 'Bearer'}, 'id': 'user',
+           'email': 'user@example.com', 'given_name': 'User'}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # saved_data and the log file are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('FLASK_SECRET_KEY', 'test')
+    return main.create_app({'DASHBOARD_LOADING': 'lazy', 'LOG_FILE': 'user.log',
+                            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'sqlite.db'}"})
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(SESSION, identity_loaded_at=time.time(),
+                       identity_token=fingerprint_token(SESSION['google_oauth_token']))
+    return client
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import utils.auth_util
+
+USERS = {'token-a': {'id': 'a', 'email': 'a@example.com', 'given_name': 'A'},
+         'token-b': {'id': 'b', 'email': 'b@example.com', 'given_name': 'B'}}
+
+
+def login(client, monkeypatch, access_token, calls):
+    # Google answers userinfo with the account the access token belongs to
+    def get(url):
+        calls.append(access_token)
+        return SimpleNamespace(ok=True, text='', json=lambda: USERS[access_token])
+
+    token = {'access_token': access_token, 'token_type': 'Bearer'}
+    monkeypatch.setattr(utils.auth_util, 'google', SimpleNamespace(authorized=True, token=token, get=get))
+    with client.session_transaction() as session:
+        session['google_oauth_token'] = token
+
+
+def test_identity_is_cached_per_token(client, monkeypatch):
+    calls = []
+    with client.session_transaction() as session:
+        session.clear()
+    login(client, monkeypatch, 'token-a', calls)
+    assert client.get('/').status_code == 200
+    assert client.get('/').status_code == 200
+    assert calls == ['token-a']
+
+    # Logging in again as another account without logging out
+    login(client, monkeypatch, 'token-b', calls)
+    assert client.get('/').status_code == 200
+    assert calls == ['token-a', 'token-b']
+    with client.session_transaction() as session:
+        assert (session['id'], session['email']) == ('b', 'b@example.com')
@@ -0,0 +1,66 @@
+import os
+import time
+import signal
+
+from utils.job_util import submit_job, get_job, get_active_job
+
+KEY = ('test', 'user')
+
+
+def wait_for_job(job_id, statuses=('done', 'failed'), timeout=10):
+    deadline = time.time() + timeout
+    while get_job(KEY, job_id)['status'] not in statuses and time.time() < deadline:
+        time.sleep(0.02)
+    return get_job(KEY, job_id)
+
+
+def run_in_worker(app, func):
+    # A forked process standing in for another gunicorn worker, the job runs there
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        with app.app_context():
+            job_id = submit_job(KEY, func)
+        os.write(write_fd, job_id.encode())
+        time.sleep(30)
+        os._exit(0)
+    os.close(write_fd)
+    return pid, os.read(read_fd, 64).decode()
+
+
+def test_job_started_in_another_worker_is_reported_and_reused(app):
+    def slow_job(report_progress):
+        report_progress(50, 'Halfway')
+        time.sleep(1)
+        return 'version'
+
+    pid, job_id = run_in_worker(app, slow_job)
+    try:
+        assert wait_for_job(job_id, statuses=('running',))['status'] == 'running'
+        assert get_active_job(KEY) == job_id
+        with app.app_context():
+            assert submit_job(KEY, lambda report_progress: 'other') == job_id
+
+        job = wait_for_job(job_id)
+        assert job['status'] == 'done' and job['result'] == 'version'
+        # The lock is released right after the final status is written
+        deadline = time.time() + 5
+        while get_active_job(KEY) is not None and time.time() < deadline:
+            time.sleep(0.02)
+        assert get_active_job(KEY) is None
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def test_job_of_a_dead_worker_is_failed(app):
+    pid, job_id = run_in_worker(app, lambda report_progress: time.sleep(30))
+    wait_for_job(job_id, statuses=('running',))
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+
+    assert get_active_job(KEY) is None
+    assert get_job(KEY, job_id)['status'] == 'failed'
+    with app.app_context():
+        job_id = submit_job(KEY, lambda report_progress: 'retried')
+    assert wait_for_job(job_id)['result'] == 'retried'
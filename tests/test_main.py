@@ -0,0 +1,26 @@
+import io
+
+import dashboards.ynab
+
+
+def test_dashboard_server_error_renders_error_page(client, monkeypatch):
+    def fail(key):
+        raise RuntimeError('job store unavailable')
+
+    monkeypatch.setattr(dashboards.ynab, 'get_active_job', fail)
+    response = client.post('/ynab/upload', data={'file': (io.BytesIO(b'zip'), 'export.zip')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 500
+    assert b'An error occurred' in response.data
+    assert b'href="/"' in response.data
+
+
+def test_dashboard_callback_for_cleared_data_is_prevented(client):
+    # A stale tab asking for figures of a version whose data was cleared
+    response = client.post('/ynab/_dash-update-component', json={
+        'output': 'cube-payload.data', 'outputs': {'id': 'cube-payload', 'property': 'data'},
+        'inputs': [{'id': 'dataset-version', 'property': 'data', 'value': 'cleared'}],
+        'changedPropIds': ['dataset-version.data'], 'state': []})
+    assert response.status_code == 204
+    assert 'dash_callback_prevented_total{callback="create_graphs_payload",dashboard="ynab"}' in \
+        client.get('/metrics').get_data(as_text=True)
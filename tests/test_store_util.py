@@ -0,0 +1,37 @@
+from utils.store_util import (get_dataset, save_dataset_version, fetch_dataset_version, get_dataset_load_count,
+                              drop_dataset)
+from utils.utils import clear_data_from_disk
+
+
+def test_stale_version_does_not_label_newer_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    disk = {'frames': {'data': 'old'}}
+    old_version = save_dataset_version(disk['frames'], 'test', 'user')
+    # Uploaded since, e.g. in another worker, so this process still holds the old frames
+    disk['frames'] = {'data': 'new'}
+    new_version = save_dataset_version(disk['frames'], 'test', 'user')
+    drop_dataset('test', 'user')
+    assert fetch_dataset_version('test', 'user') == new_version
+
+    # A stale tab asks for the old version and gets the data on disk, stored under the version on disk
+    assert get_dataset('test', 'user', old_version, lambda: disk['frames']) == {'data': 'new'}
+    assert get_dataset_load_count('test', 'user', new_version) == 1
+    assert get_dataset_load_count('test', 'user', old_version) == 0
+
+    # The current tab shares it without parsing again, and so does the stale tab
+    assert get_dataset('test', 'user', new_version, lambda: disk['frames']) == {'data': 'new'}
+    assert get_dataset('test', 'user', old_version, lambda: disk['frames']) == {'data': 'new'}
+    assert get_dataset_load_count('test', 'user', new_version) == 1
+
+
+def test_cleared_data_is_not_loaded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    version = save_dataset_version({'data': 'saved'}, 'test', 'user')
+    # Cleared in another tab, a stale tab still holds the version
+    clear_data_from_disk('test', 'user')
+    drop_dataset('test', 'user')
+
+    def loader():
+        raise AssertionError('the loader must not run')
+
+    assert get_dataset('test', 'user', version, loader) is None
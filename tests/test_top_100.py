@@ -0,0 +1,89 @@
+import pandas as pd
+
+from dashboards.top_100 import (create_tracks_encoded, create_artist_presence, create_song_length_figure,
+                                create_song_length_summary_figure, SONG_LENGTH_PAYLOAD_BUDGET,
+                                SONG_LENGTH_POINTS_THRESHOLD)
+from utils.utils import get_figure_size
+from benchmarks.synthetic import generate_top_100_tracks
+
+
+def create_artist_presence_loop(tracks_encoded, years):
+    # The per-artist scan create_artist_presence replaced, kept as the reference
+    artists = list(set([j for i in tracks_encoded.artists.to_list() for j in i]))
+
+    artist_presence = []
+    for artist in artists:
+        temp = (tracks_encoded.loc[tracks_encoded['artists'].apply(lambda x: artist in x), years]).sum().to_dict()
+        temp["artist"] = artist
+        artist_presence.append(temp)
+
+    artist_presence = pd.DataFrame(artist_presence)
+    artist_presence['occurances'] = artist_presence[years].sum(axis=1)
+    artist_presence = artist_presence.sort_values('occurances', ascending=False)
+    return artist_presence
+
+
+def create_tracks():
+    rows = [
+        ('Song A', ['Artist 1'], 'Album A', 2019),
+        ('Song A', ['Artist 1'], 'Album A', 2020),
+        ('Song B', ['Artist 1', 'Artist 2'], 'Album B', 2020),
+        # The same artist listed twice on one track
+        ('Song C', ['Artist 3', 'Artist 3'], 'Album C', 2019),
+        ('Song C', ['Artist 3', 'Artist 3'], 'Album C', 2021),
+        ('Song D', ['Artist 2', 'Artist 4', 'Artist 1'], 'Album D', 2021),
+        ('Song E', ['Artist 4'], 'Album E', 2019),
+        ('Song E', ['Artist 4'], 'Album E', 2020),
+        ('Song E', ['Artist 4'], 'Album E', 2021),
+    ]
+    tracks = pd.DataFrame(rows, columns=['name', 'artists', 'album', 'playlist_year'])
+    tracks['playlist_name'] = 'Your Top Songs ' + tracks['playlist_year'].astype(str)
+    tracks['my_id'] = tracks['name'] + "--" + tracks['artists'].apply(', '.join) + "--" + tracks['album']
+    return tracks
+
+
+def test_create_artist_presence_matches_loop():
+    tracks_encoded, years = create_tracks_encoded(create_tracks())
+    expected = create_artist_presence_loop(tracks_encoded, years)
+    artist_presence = create_artist_presence(tracks_encoded, years)
+
+    # The loop visits the artists in set order, so rows are compared by artist
+    pd.testing.assert_frame_equal(artist_presence.sort_values('artist', ignore_index=True),
+                                  expected.sort_values('artist', ignore_index=True))
+    assert artist_presence['occurances'].is_monotonic_decreasing
+    assert artist_presence.set_index('artist').loc['Artist 3', 'occurances'] == 2
+
+
+def create_song_length_inputs(years, tracks_per_year):
+    tracks = generate_top_100_tracks(years=years, tracks_per_year=tracks_per_year, artists=5000)
+    return tracks, sorted(tracks['playlist_year'].unique())
+
+
+def count_sampled_points(song_length_fig):
+    return sum(len(trace.y) for trace in song_length_fig.data if trace.type == 'scattergl')
+
+
+def test_song_length_figure_summarises_large_inputs_within_budget():
+    tracks, years = create_song_length_inputs(15, 1000)
+    song_length_fig, color_map = create_song_length_figure(tracks, years)
+    assert {trace.type for trace in song_length_fig.data} == {'scatter', 'box', 'scattergl'}
+    assert get_figure_size(song_length_fig) <= SONG_LENGTH_PAYLOAD_BUDGET
+    assert count_sampled_points(song_length_fig) == SONG_LENGTH_POINTS_THRESHOLD
+    assert set(color_map) == set(years)
+
+
+def test_song_length_figure_keeps_every_point_of_small_inputs():
+    tracks, years = create_song_length_inputs(3, 100)
+    song_length_fig, _ = create_song_length_figure(tracks, years)
+    assert {trace.type for trace in song_length_fig.data} == {'violin'}
+    assert sum(len(trace.y) for trace in song_length_fig.data) == len(tracks)
+
+
+def test_song_length_figure_halves_the_sample_to_fit_the_budget():
+    tracks, years = create_song_length_inputs(15, 1000)
+    _, color_map = create_song_length_figure(tracks, years)
+    # Too small for the full sample, enough for half of it
+    payload_budget = get_figure_size(create_song_length_summary_figure(tracks, years, color_map, 500))
+    song_length_fig, _ = create_song_length_figure(tracks, years, payload_budget=payload_budget)
+    assert get_figure_size(song_length_fig) <= payload_budget
+    assert count_sampled_points(song_length_fig) == 500
@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+from dashboards.ynab import (prepare_register, prepare_budget, create_cubes, merge_ynab_export, parse_currency_cents,
+                             parse_register_dates, REGISTER_DTYPES, BUDGET_DTYPES)
+from benchmarks.synthetic import generate_ynab_register, generate_ynab_budget
+
+
+@pytest.mark.parametrize('value, cents', [
+    ('$1,234.56', 123456),
+    ('-$12.30', -1230),
+    ('($5.00)', -500),
+    ('1.234,56 €', 123456),
+    # A separator followed by three digits groups thousands
+    ('€1.234', 123400),
+    ('$5.5', 550),
+    (None, 0),
+])
+def test_parse_currency_cents(value, cents):
+    assert parse_currency_cents(pd.Series(['$0.01', value, '$0.01'])).tolist() == [1, cents, 1]
+
+
+def test_parse_currency_cents_empty():
+    cents = parse_currency_cents(pd.Series([], dtype=object))
+    assert len(cents) == 0 and cents.dtype == 'int64'
+
+
+@pytest.mark.parametrize('values, expected', [
+    (['01/13/2023', '03/02/2023'], ['2023-01-13', '2023-03-02']),
+    # DD/MM, 13/01 can't be a month first date so the whole column is read day first
+    (['02/03/2023', '13/01/2023'], ['2023-03-02', '2023-01-13']),
+    (['2023-01-13', None], ['2023-01-13', None]),
+    (['13.01.2023', '02.03.2023'], ['2023-01-13', '2023-03-02']),
+])
+def test_parse_register_dates(values, expected):
+    dates = parse_register_dates(pd.Series(values))
+    pd.testing.assert_series_equal(dates, pd.Series(pd.to_datetime(expected)), check_names=False)
+
+
+def create_saved_data(rows=5000):
+    register_df = prepare_register(generate_ynab_register(rows).astype(REGISTER_DTYPES))
+    budget_df = prepare_budget(generate_ynab_budget().astype(BUDGET_DTYPES))
+    saved = {'register': register_df, 'budget': budget_df}
+    return saved, create_cubes(register_df, budget_df)
+
+
+def merge_subset(saved, cubes, subset):
+    export_df = saved['register'][subset].reset_index(drop=True)
+    return merge_ynab_export(saved, cubes, export_df, saved['budget'].copy())
+
+
+def assert_unchanged(saved, cubes, merged):
+    register_df, budget_df, merged_cubes, changes = merged
+    assert changes == {'added': 0, 'removed': 0, 'months': 0}
+    assert len(register_df) == len(saved['register'])
+    totals = ['Outflow', 'Inflow']
+    pd.testing.assert_series_equal(register_df[totals].sum(), saved['register'][totals].sum())
+    pd.testing.assert_series_equal(merged_cubes['register_cube'][totals].sum(), cubes['register_cube'][totals].sum())
+
+
+def test_merge_single_account_export_keeps_other_accounts():
+    saved, cubes = create_saved_data()
+    merged = merge_subset(saved, cubes, saved['register']['Account'] == 'Checking')
+    assert_unchanged(saved, cubes, merged)
+
+
+def test_merge_export_starting_mid_month_keeps_earlier_rows():
+    saved, cubes = create_saved_data()
+    dates = saved['register']['Date']
+    start = dates.dt.to_period('M').max().start_time - pd.DateOffset(months=6) + pd.Timedelta(days=14)
+    merged = merge_subset(saved, cubes, dates >= start)
+    assert_unchanged(saved, cubes, merged)
+
+
+def test_merge_replaces_changed_rows_of_exported_accounts():
+    saved, cubes = create_saved_data()
+    export_df = saved['register'][saved['register']['Account'] == 'Checking'].reset_index(drop=True)
+    export_df.loc[0, 'Outflow'] += 100
+    register_df, _, merged_cubes, changes = merge_ynab_export(saved, cubes, export_df, saved['budget'].copy())
+    assert changes['added'] == 1 and changes['removed'] == 1
+    assert len(register_df) == len(saved['register'])
+    assert register_df['Outflow'].sum() == saved['register']['Outflow'].sum() + 100
+    assert merged_cubes['register_cube']['Outflow'].sum() == cubes['register_cube']['Outflow'].sum() + 100
@@ -0,0 +1,52 @@
+import time
+import hashlib
+
+from flask import current_app, session, request, redirect
+from flask_dance.contrib.google import google
+
+# The Google identity is kept in the session and only asked for again after this many seconds
+IDENTITY_TTL = 60 * 60
+# Dash serves its scripts, styles and assets under the dashboard prefix, they don't need a login
+PUBLIC_PATH_SEGMENTS = {'assets', '_dash-component-suites', '_favicon.ico', 'static'}
+
+
+def init_auth_gate(server, protected_segments):
+    # One hook per server whatever the number of dashboards, the first path segment ('' for the home page)
+    # is looked up in a set instead of checking every dashboard prefix in turn
+    protected_segments = frozenset(protected_segments)
+
+    @server.before_request
+    def require_login():
+        segments = request.path.lstrip('/').split('/', 2)
+        if segments[0] not in protected_segments or (len(segments) > 1 and segments[1] in PUBLIC_PATH_SEGMENTS):
+            return None
+        if not google.authorized:
+            # The welcome page belongs to the main app, not to the dashboard servers
+            return redirect("/welcome")
+        load_identity()
+
+
+def load_identity():
+    # Calls Google's userinfo once per login instead of on every page view. The identity belongs to the token it
+    # was loaded with, logging in again (maybe as another Google account) without logging out reloads it
+    token_fingerprint = fingerprint_token(google.token)
+    if 'id' in session and session.get('identity_token') == token_fingerprint and \
+            session.get('identity_loaded_at', 0) > time.time() - IDENTITY_TTL:
+        return
+
+    resp = google.get("/oauth2/v1/userinfo")
+    assert resp.ok, resp.text
+    user_info = resp.json()
+    first_login = session.get('id') != user_info['id']
+    session['id'] = user_info['id']
+    session['email'] = user_info['email']
+    session['given_name'] = user_info['given_name']
+    session['identity_loaded_at'] = time.time()
+    session['identity_token'] = token_fingerprint
+
+    if first_login:
+        current_app.logger.info(f"User logged in: email={session['email']}, name={session['given_name']}")
+
+
+def fingerprint_token(token):
+    return hashlib.sha256(token['access_token'].encode()).hexdigest()[:16]
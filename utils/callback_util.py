@@ -0,0 +1,13 @@
+def wrap_callbacks(dash_app, wrapper):
+    # Replaces every server side callback of the Dash app with wrapper(callback), clientside callbacks run in the
+    # browser. Dash keeps the callback returning the JSON response body in the callback map
+    for callback_spec in dash_app.callback_map.values():
+        if 'callback' in callback_spec:
+            callback_spec['callback'] = wrapper(callback_spec['callback'])
+
+
+def is_prevented_update(exception):
+    # Imported here so booting the main app doesn't import Dash before a dashboard is loaded
+    from dash.exceptions import PreventUpdate
+
+    return isinstance(exception, PreventUpdate)
@@ -1,17 +1,61 @@
 import os
-import json
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert
 
 db = SQLAlchemy()
 
-# Read the dashboard config for the table names
-with open("dashboards_config.json", "r") as f:
-    dashboards_data = json.load(f)
-    dashboard_storage_metadata = {dashboard['file']: dashboard.get('storage',[]) for dashboard in dashboards_data["dashboards"]}
-
 
 def init_db(app):
     db_path = os.path.join(os.path.abspath(__file__ + '/../../'), 'sqlite.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', f'sqlite:///{db_path}')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
+    # Forked workers (e.g. gunicorn --preload) open their own connections instead of sharing the parent's
+    os.register_at_fork(after_in_child=lambda: dispose_engines(app))
+
+
+def dispose_engines(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+# Genres change rarely, so cached artists are shared across users and only refreshed after the TTL
+ARTIST_GENRES_TTL = timedelta(days=30)
+# Keeps each statement well under SQLite's bound parameter limit
+SQLITE_BATCH_SIZE = 200
+
+
+class ArtistGenres(db.Model):
+    artist_id = db.Column(db.String(64), primary_key=True)
+    name = db.Column(db.String(512), nullable=False)
+    genres = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+def fetch_cached_artist_genres(artist_ids):
+    fresh_after = datetime.utcnow() - ARTIST_GENRES_TTL
+    cached_artists = {}
+    for i in range(0, len(artist_ids), SQLITE_BATCH_SIZE):
+        rows = db.session.execute(
+            db.select(ArtistGenres)
+            .where(ArtistGenres.artist_id.in_(artist_ids[i:i + SQLITE_BATCH_SIZE]))
+            .where(ArtistGenres.updated_at >= fresh_after)
+        ).scalars()
+        cached_artists.update({row.artist_id: {'name': row.name, 'genres': row.genres} for row in rows})
+    return cached_artists
+
+
+def save_artist_genres(artists):
+    updated_at = datetime.utcnow()
+    rows = [{'artist_id': artist['id'], 'name': artist['name'], 'genres': artist['genres'], 'updated_at': updated_at}
+            for artist in artists]
+    for i in range(0, len(rows), SQLITE_BATCH_SIZE):
+        stmt = insert(ArtistGenres).values(rows[i:i + SQLITE_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ArtistGenres.artist_id],
+            set_={'name': stmt.excluded.name, 'genres': stmt.excluded.genres, 'updated_at': stmt.excluded.updated_at},
+        )
+        db.session.execute(stmt)
+    db.session.commit()
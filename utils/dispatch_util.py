@@ -0,0 +1,46 @@
+import os
+import threading
+
+
+class DashboardDispatcher:
+    # WSGI middleware giving every dashboard's URL prefix its own Flask server. Flask doesn't allow routes to be
+    # added once the app is serving, so each dashboard server is created on its first request (or by warm_up)
+    # and the dashboard module, with pandas, plotly and the rest, is only imported then
+    def __init__(self, default_app, dashboard_metadata_list, create_server):
+        self.default_app = default_app
+        self.create_server = create_server
+        self.dashboards = {dashboard_metadata['url_base_pathname'].strip('/'): dashboard_metadata
+                           for dashboard_metadata in dashboard_metadata_list}
+        self.servers = {}
+        self.server_locks = {name: threading.Lock() for name in self.dashboards}
+        # A fork may happen while the warm-up thread holds a lock, the thread doesn't exist in the child
+        os.register_at_fork(after_in_child=self.reset_locks)
+
+    def reset_locks(self):
+        self.server_locks = {name: threading.Lock() for name in self.dashboards}
+
+    def get_server(self, name):
+        server = self.servers.get(name)
+        if server is None:
+            # Requests arriving while the server is being created wait for it instead of creating another one
+            with self.server_locks[name]:
+                server = self.servers.get(name)
+                if server is None:
+                    server = self.servers[name] = self.create_server(self.dashboards[name])
+        return server
+
+    def load_all(self):
+        for name in self.dashboards:
+            self.get_server(name)
+
+    def warm_up(self):
+        # Creates the dashboard servers in the background so the first visitor doesn't wait for them
+        thread = threading.Thread(target=self.load_all, name='dashboard-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def __call__(self, environ, start_response):
+        name = environ.get('PATH_INFO', '').lstrip('/').split('/', 1)[0]
+        if name in self.dashboards:
+            return self.get_server(name)(environ, start_response)
+        return self.default_app(environ, start_response)
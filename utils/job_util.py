@@ -0,0 +1,138 @@
+import os
+import json
+import uuid
+import fcntl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+# Jobs beyond this many wait in the queue instead of competing for CPU with the web workers
+JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS', 2))
+
+# A job is keyed by (dashboard folder, user) and its status is kept in that user's saved_data folder, so any
+# worker can report it. The job holds a lock on job.lock until it finishes, the OS releases it if the worker dies
+JOB_STATUS_FILE = 'job.json'
+JOB_LOCK_FILE = 'job.lock'
+
+_job_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix='job')
+# Lock files of the jobs queued or running in this process
+_job_lock_files = set()
+_job_lock_files_lock = threading.Lock()
+
+
+def _reset_jobs_after_fork():
+    # The executor threads don't exist in a forked worker, and the parent's jobs can never finish there.
+    # The parent keeps holding their locks, the worker only drops its copies
+    global _job_executor, _job_lock_files_lock
+    _job_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix='job')
+    _job_lock_files_lock = threading.Lock()
+    for lock_file in _job_lock_files:
+        lock_file.close()
+    _job_lock_files.clear()
+
+
+os.register_at_fork(after_in_child=_reset_jobs_after_fork)
+
+
+def _job_path(key, filename):
+    save_folder, userid = key
+    return os.path.join('saved_data', save_folder, userid, filename)
+
+
+def _write_job(key, job):
+    path = _job_path(key, JOB_STATUS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(job, f)
+    os.replace(path + '.tmp', path)
+
+
+def _read_job(key):
+    try:
+        with open(_job_path(key, JOB_STATUS_FILE), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _acquire_job_lock(key):
+    # None when a job of the same key is queued or running, in this worker or any other
+    path = _job_path(key, JOB_LOCK_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    with _job_lock_files_lock:
+        _job_lock_files.add(lock_file)
+    return lock_file
+
+
+def _release_job_lock(lock_file):
+    with _job_lock_files_lock:
+        _job_lock_files.discard(lock_file)
+    lock_file.close()
+
+
+def submit_job(key, func, *args):
+    # A job already queued or running for the same key (e.g. the same user's fetch) is reused
+    app = current_app._get_current_object()
+    lock_file = _acquire_job_lock(key)
+    if lock_file is None:
+        return get_active_job(key)
+
+    job = {'id': uuid.uuid4().hex, 'status': 'queued', 'progress': 0, 'message': 'Waiting in queue',
+           'result': None, 'error': None}
+    _write_job(key, job)
+    _job_executor.submit(_run_job, app, key, job, lock_file, func, args)
+    return job['id']
+
+
+def get_job(key, job_id):
+    job = _read_job(key)
+    if job is None or job['id'] != job_id:
+        return None
+    if job['status'] in ('queued', 'running') and get_active_job(key) is None:
+        # Either it finished since the status was read, or the worker running it died before it could finish
+        job = _read_job(key)
+        if job is None or job['status'] in ('queued', 'running'):
+            return {'id': job_id, 'status': 'failed', 'progress': 0, 'message': '', 'result': None,
+                    'error': 'The job was interrupted'}
+    return job
+
+
+def get_active_job(key):
+    # Taking a shared lock fails while a job holds the exclusive one
+    lock_path = _job_path(key, JOB_LOCK_FILE)
+    if not os.path.exists(lock_path):
+        return None
+    with open(lock_path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            job = _read_job(key)
+            return job['id'] if job is not None else None
+    return None
+
+
+def _update_job(key, job, **job_update):
+    job.update(job_update)
+    _write_job(key, job)
+
+
+def _run_job(app, key, job, lock_file, func, args):
+    try:
+        with app.app_context():
+            _update_job(key, job, status='running', message='Starting')
+            try:
+                result = func(lambda progress, message: _update_job(key, job, progress=progress, message=message), *args)
+            except Exception as e:
+                app.logger.error(f"Job {job['id']} failed: {e}", exc_info=True)
+                _update_job(key, job, status='failed', error=str(e))
+            else:
+                _update_job(key, job, status='done', progress=100, message='Done', result=result)
+    finally:
+        _release_job_lock(lock_file)
@@ -0,0 +1,115 @@
+import os
+import json
+import hmac
+import time
+import queue
+import atexit
+import hashlib
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, request, session
+from flask.logging import default_handler
+
+# Attributes every LogRecord has, anything else was passed with extra= and becomes a field of the JSON line
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+# One queue and writer thread per log file and process, the request threads only put records on the queue
+_log_pipelines = {}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), 'level': record.levelname,
+                 'pid': record.process, 'message': record.getMessage()}
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def init_logging(app):
+    # Flask's logger is shared by every app created in the process, so is the pipeline of each log file.
+    # Flask's own stderr handler would write every record on the request thread, records only go through the queue
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(logging.INFO)
+    log_path = os.path.abspath(app.config['LOG_FILE'])
+    if log_path not in _log_pipelines:
+        max_bytes, backup_count = app.config['LOG_MAX_BYTES'], app.config['LOG_BACKUP_COUNT']
+        _log_pipelines[log_path] = _start_log_pipeline(log_path, max_bytes, backup_count)
+    queue_handler = _log_pipelines[log_path]['queue_handler']
+    if queue_handler not in app.logger.handlers:
+        app.logger.addHandler(queue_handler)
+
+
+def _create_file_handler(log_path, max_bytes, backup_count):
+    file_handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    # Records arrive already formatted as JSON by the queue handler
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+    return file_handler
+
+
+def _start_log_pipeline(log_path, max_bytes, backup_count):
+    file_handler = _create_file_handler(log_path, max_bytes, backup_count)
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    listener.start()
+    return {'queue_handler': queue_handler, 'file_handler': file_handler, 'listener': listener,
+            'max_bytes': max_bytes, 'backup_count': backup_count}
+
+
+def _restart_log_pipelines_after_fork():
+    # The writer thread doesn't survive a fork (e.g. gunicorn --preload), every worker gets a queue and writer
+    # of its own. Processes can't rotate a shared file safely, so each worker writes and rotates e.g. user.<pid>.log
+    for log_path, pipeline in _log_pipelines.items():
+        pipeline['file_handler'].close()
+        root, extension = os.path.splitext(log_path)
+        pipeline['file_handler'] = _create_file_handler(f'{root}.{os.getpid()}{extension}', pipeline['max_bytes'],
+                                                        pipeline['backup_count'])
+        pipeline['queue_handler'].queue = queue.SimpleQueue()
+        pipeline['listener'] = QueueListener(pipeline['queue_handler'].queue, pipeline['file_handler'],
+                                             respect_handler_level=True)
+        pipeline['listener'].start()
+
+
+os.register_at_fork(after_in_child=_restart_log_pipelines_after_fork)
+
+
+def stop_logging():
+    # Writes out the records still queued, runs at exit
+    while _log_pipelines:
+        _, pipeline = _log_pipelines.popitem()
+        pipeline['listener'].stop()
+        pipeline['file_handler'].close()
+
+
+atexit.register(stop_logging)
+
+
+def init_request_logging(server):
+    # Register before the auth gate so redirected requests are timed too
+    @server.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @server.after_request
+    def log_request(response):
+        latency = time.perf_counter() - g.get('request_started_at', time.perf_counter())
+        server.logger.info('Request', extra={
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule is not None else request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency * 1000, 2),
+            'response_bytes': response.content_length,
+            'user': hash_user_id(session['id']) if 'id' in session else None,
+        })
+        return response
+
+
+def hash_user_id(user_id):
+    # Keyed with the app secret so a user's requests can be followed without the logs revealing their Google id
+    secret_key = current_app.secret_key or ''
+    if isinstance(secret_key, str):
+        secret_key = secret_key.encode()
+    return hmac.new(secret_key, str(user_id).encode(), hashlib.sha256).hexdigest()[:16]
@@ -0,0 +1,204 @@
+import os
+import glob
+import json
+import time
+import atexit
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from flask import request
+
+from utils.callback_util import is_prevented_update
+
+# Histogram buckets, durations in seconds and payloads in bytes
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+# How often (seconds) a worker writes its metrics for the other workers to aggregate
+METRICS_FLUSH_INTERVAL = 5
+
+METRICS = {
+    'dash_callback_duration_seconds': ('histogram', 'Wall time of Dash callbacks', DURATION_BUCKETS),
+    'dash_callback_phase_duration_seconds': ('histogram', 'Time spent in each phase of Dash callbacks, dash covers '
+                                             'validation and JSON serialization', DURATION_BUCKETS),
+    'dash_callback_request_bytes': ('histogram', 'Size of Dash callback requests', BYTES_BUCKETS),
+    'dash_callback_response_bytes': ('histogram', 'Size of Dash callback responses', BYTES_BUCKETS),
+    'dash_callback_prevented_total': ('counter', 'Dash callbacks that raised PreventUpdate', None),
+    'dash_callback_errors_total': ('counter', 'Dash callbacks that raised an error', None),
+}
+
+# (metric name, sorted label items) -> counter value, or bucket counts + sum + count of a histogram
+_samples = {}
+_samples_lock = threading.Lock()
+_metrics_dir = None
+_flush_thread = None
+
+# Labels and phase timings of the callback running in the current request
+_current_callback = contextvars.ContextVar('current_callback', default=None)
+
+
+def observe(name, labels, value):
+    buckets = METRICS[name][2]
+    key = (name, tuple(sorted(labels.items())))
+    with _samples_lock:
+        sample = _samples.get(key)
+        if sample is None:
+            sample = _samples[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for idx, bound in enumerate(buckets):
+            if value <= bound:
+                sample['buckets'][idx] += 1
+        sample['sum'] += value
+        sample['count'] += 1
+
+
+def increment(name, labels, amount=1):
+    key = (name, tuple(sorted(labels.items())))
+    with _samples_lock:
+        _samples[key] = _samples.get(key, 0) + amount
+
+
+@contextmanager
+def measure_phase(phase):
+    # Times a phase (e.g. pandas or plotly) of the callback running in this request, a no-op anywhere else
+    phases = _current_callback.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if phases is not None:
+            phases[phase] = phases.get(phase, 0) + time.perf_counter() - start
+
+
+def instrument_callback(callback, dashboard):
+    labels = {'dashboard': dashboard, 'callback': callback.__name__}
+
+    @functools.wraps(callback)
+    def instrumented_callback(*args, **kwargs):
+        phases = {}
+        token = _current_callback.set(phases)
+        start = time.perf_counter()
+        try:
+            response = callback(*args, **kwargs)
+        except Exception as e:
+            increment('dash_callback_prevented_total' if is_prevented_update(e) else 'dash_callback_errors_total', labels)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_callback.reset(token)
+            observe('dash_callback_duration_seconds', labels, duration)
+            observe('dash_callback_request_bytes', labels, request.content_length or 0)
+            # Whatever the phases don't cover is Dash's own work, mostly serializing the response
+            phases['dash'] = max(duration - sum(phases.values()), 0)
+            for phase, phase_duration in phases.items():
+                observe('dash_callback_phase_duration_seconds', {**labels, 'phase': phase}, phase_duration)
+
+        observe('dash_callback_response_bytes', labels, len(response.encode()))
+        return response
+
+    return instrumented_callback
+
+
+def init_metrics(app):
+    # With several workers (gunicorn), each worker writes its metrics to METRICS_DIR and /metrics adds them up.
+    # Like prometheus_client's multiprocess mode, empty the directory when deploying
+    global _metrics_dir, _flush_thread
+    if app.config['METRICS_DIR'] is None or _metrics_dir is not None:
+        return
+    _metrics_dir = os.path.abspath(app.config['METRICS_DIR'])
+    os.makedirs(_metrics_dir, exist_ok=True)
+    _flush_thread = _start_flush_thread()
+
+
+def _start_flush_thread():
+    def flush_periodically():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            flush_metrics()
+
+    thread = threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True)
+    thread.start()
+    return thread
+
+
+def _reset_metrics_after_fork():
+    # The parent's samples stay in the parent's file, a worker only counts its own work
+    global _samples_lock, _flush_thread
+    _samples_lock = threading.Lock()
+    _samples.clear()
+    if _flush_thread is not None:
+        _flush_thread = _start_flush_thread()
+
+
+os.register_at_fork(after_in_child=_reset_metrics_after_fork)
+
+
+def snapshot_metrics():
+    with _samples_lock:
+        return [[name, dict(labels), dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value]
+                for (name, labels), value in _samples.items()]
+
+
+def flush_metrics():
+    if _metrics_dir is None:
+        return
+    path = os.path.join(_metrics_dir, f'metrics-{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot_metrics(), f)
+    os.replace(path + '.tmp', path)
+
+
+atexit.register(flush_metrics)
+
+
+def collect_metrics():
+    # Adds up the samples of every worker, including the ones that have exited since their counters still count
+    if _metrics_dir is None:
+        worker_samples = [snapshot_metrics()]
+    else:
+        flush_metrics()
+        worker_samples = []
+        for path in glob.glob(os.path.join(_metrics_dir, 'metrics-*.json')):
+            with open(path, 'r') as f:
+                worker_samples.append(json.load(f))
+
+    collected = {}
+    for samples in worker_samples:
+        for name, labels, value in samples:
+            key = (name, tuple(sorted(labels.items())))
+            if isinstance(value, dict):
+                total = collected.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], value['buckets'])]
+                total['sum'] += value['sum']
+                total['count'] += value['count']
+            else:
+                collected[key] = collected.get(key, 0) + value
+    return collected
+
+
+def render_metrics():
+    # Prometheus text exposition format
+    collected = collect_metrics()
+    lines = []
+    for name, (metric_type, description, buckets) in METRICS.items():
+        samples = sorted((labels, value) for (sample_name, labels), value in collected.items() if sample_name == name)
+        if not samples:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in samples:
+            if metric_type == 'counter':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            for bound, bucket_count in zip(buckets, value['buckets']):
+                # Buckets are counted cumulatively when observed
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {bucket_count}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {value["count"]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value["sum"]}')
+            lines.append(f'{name}_count{format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
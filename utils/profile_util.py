@@ -0,0 +1,136 @@
+import io
+import os
+import glob
+import json
+import time
+import pstats
+import cProfile
+import datetime
+import functools
+import threading
+import tracemalloc
+
+from flask import current_app, request, session
+
+from utils.log_util import hash_user_id
+from utils.callback_util import is_prevented_update
+
+# Sending this header with a Dash request profiles its callback when the user is one of PROFILE_ADMINS,
+# PROFILE_CALLBACKS profiles every callback
+PROFILE_HEADER = 'X-Profile-Callback'
+# Older profiles are deleted beyond this many
+PROFILE_MAX_ENTRIES = 200
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 25
+
+# tracemalloc traces the whole process, so profiled callbacks run one at a time
+_profile_lock = threading.Lock()
+
+
+def profile_callback(callback, dashboard):
+    @functools.wraps(callback)
+    def profiled_callback(*args, **kwargs):
+        # Profiling slows down every request of the process, users can't turn it on themselves
+        if not current_app.config['PROFILE_CALLBACKS'] and \
+                (request.headers.get(PROFILE_HEADER) != '1' or not is_profile_admin()):
+            return callback(*args, **kwargs)
+        with _profile_lock:
+            return run_profiled(callback, dashboard, args, kwargs)
+
+    return profiled_callback
+
+
+def is_profile_admin():
+    return session.get('id') in current_app.config['PROFILE_ADMINS']
+
+
+def run_profiled(callback, dashboard, args, kwargs):
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    outcome = 'ok'
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return callback(*args, **kwargs)
+    except Exception as e:
+        outcome = 'prevented' if is_prevented_update(e) else 'error'
+        raise
+    finally:
+        profiler.disable()
+        duration = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        save_profile(profiler, snapshot, {
+            'dashboard': dashboard,
+            'callback': callback.__name__,
+            'timestamp': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'duration': duration,
+            'peak_bytes': peak_bytes,
+            'outcome': outcome,
+            'user': hash_user_id(session['id']) if 'id' in session else None,
+            'pid': os.getpid(),
+        })
+
+
+def save_profile(profiler, snapshot, profile):
+    # Saved as <dashboard>/<callback>/<timestamp>-<pid> with a .prof for snakeviz or pstats, a readable .txt
+    # report and a .json summary for the profiles page
+    profile_dir = os.path.abspath(current_app.config['PROFILE_DIR'])
+    key = f"{profile['timestamp'].replace(':', '').replace('.', '-')}-{profile['pid']}"
+    path = os.path.join(profile_dir, profile['dashboard'], profile['callback'], key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profile['path'] = os.path.relpath(path, profile_dir)
+
+    profiler.dump_stats(path + '.prof')
+    with open(path + '.txt', 'w') as f:
+        f.write(create_profile_report(profiler, snapshot, profile))
+    with open(path + '.json', 'w') as f:
+        json.dump(profile, f)
+
+    prune_profiles(profile_dir)
+    current_app.logger.info(f"Callback profiled: dashboard={profile['dashboard']}, callback={profile['callback']}, "
+                            f"duration={profile['duration']:.3f}s, path={profile['path']}")
+
+
+def create_profile_report(profiler, snapshot, profile):
+    report = io.StringIO()
+    report.write(f"{profile['dashboard']} {profile['callback']} at {profile['timestamp']} ({profile['outcome']})\n")
+    report.write(f"Wall time: {profile['duration']:.3f}s, peak traced memory: {profile['peak_bytes'] / 2 ** 20:.1f} MiB\n\n")
+
+    report.write(f"Top {PROFILE_TOP_FUNCTIONS} functions by cumulative time\n")
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+
+    # Memory still allocated when the callback returned, e.g. cached datasets and the response
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                       tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')])
+    report.write(f"\nTop {PROFILE_TOP_ALLOCATIONS} allocation sites still holding memory\n")
+    for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+        report.write(f"{stat.size / 2 ** 10:10.1f} KiB {stat.count:8} blocks  {stat.traceback}\n")
+    return report.getvalue()
+
+
+def prune_profiles(profile_dir):
+    summaries = sorted(glob.glob(os.path.join(profile_dir, '*', '*', '*.json')), key=os.path.getmtime)
+    for summary in summaries[:-PROFILE_MAX_ENTRIES]:
+        for extension in ['.json', '.prof', '.txt']:
+            try:
+                os.remove(summary[:-len('.json')] + extension)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(profile_dir, limit=50):
+    profiles = []
+    for summary in glob.glob(os.path.join(os.path.abspath(profile_dir), '*', '*', '*.json')):
+        try:
+            with open(summary, 'r') as f:
+                profiles.append(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Pruned or still being written by another worker
+            continue
+    return sorted(profiles, key=lambda profile: profile['timestamp'], reverse=True)[:limit]
@@ -0,0 +1,58 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import spotipy
+
+SPOTIFY_MAX_WORKERS = 8
+SPOTIFY_MAX_RETRIES = 5
+SPOTIFY_BACKOFF_FACTOR = 0.5
+SPOTIFY_ARTISTS_BATCH_SIZE = 50
+
+
+def create_spotify_client(access_token, max_workers=SPOTIFY_MAX_WORKERS, prefix=None):
+    # The client is shared by the fetch threads, so it holds a plain token instead of the session bound auth manager
+    requests_session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    requests_session.mount('https://', adapter)
+    requests_session.mount('http://', adapter)
+
+    sp = spotipy.Spotify(auth=access_token, requests_session=requests_session)
+    if prefix is not None:
+        sp.prefix = prefix
+    return sp
+
+
+def call_with_retry(func, *args, max_retries=SPOTIFY_MAX_RETRIES, backoff_factor=SPOTIFY_BACKOFF_FACTOR):
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args)
+        except spotipy.SpotifyException as e:
+            if attempt == max_retries or not (e.http_status == 429 or e.http_status >= 500):
+                raise
+            # Honour Spotify's Retry-After on rate limiting, otherwise back off exponentially
+            retry_after = (e.headers or {}).get('Retry-After')
+            delay = float(retry_after) if retry_after else backoff_factor * 2 ** attempt
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == max_retries:
+                raise
+            delay = backoff_factor * 2 ** attempt
+        time.sleep(delay + random.uniform(0, backoff_factor))
+
+
+def fetch_concurrently(func, args_list, max_workers=SPOTIFY_MAX_WORKERS):
+    # Results keep the order of args_list
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda args: call_with_retry(func, *args), args_list))
+
+
+def fetch_playlists(sp, playlist_ids, max_workers=SPOTIFY_MAX_WORKERS):
+    return fetch_concurrently(sp.playlist, [(playlist_id,) for playlist_id in playlist_ids], max_workers=max_workers)
+
+
+def fetch_artists(sp, artist_ids, max_workers=SPOTIFY_MAX_WORKERS):
+    batches = [(artist_ids[i:i + SPOTIFY_ARTISTS_BATCH_SIZE],)
+               for i in range(0, len(artist_ids), SPOTIFY_ARTISTS_BATCH_SIZE)]
+    responses = fetch_concurrently(sp.artists, batches, max_workers=max_workers)
+    return [artist for response in responses for artist in response['artists'] if artist is not None]
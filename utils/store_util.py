@@ -0,0 +1,187 @@
+import os
+import json
+import uuid
+import threading
+from collections import OrderedDict, Counter
+
+from flask import current_app, has_app_context
+from plotly.utils import PlotlyJSONEncoder
+
+from utils.utils import save_data_to_disk, fetch_data_from_disk, check_if_saved_data_exists
+
+# Number of (dashboard, user) datasets kept in process memory before the least recently used one is evicted
+DATASET_STORE_MAX_ENTRIES = 64
+
+# Total size of serialized figures kept in process memory before the least recently used ones are evicted
+FIGURE_CACHE_MAX_BYTES = 64 * 2 ** 20
+
+# Server-side dataset store, the browser only keeps the version token of its dataset
+_dataset_store = OrderedDict()
+_dataset_store_lock = threading.Lock()
+# Loads in progress, so callbacks fired by the same update wait for a single parse instead of each parsing
+_dataset_load_locks = {}
+# Number of times each (dashboard, user, dataset version) was parsed from disk by this process
+_dataset_load_counts = Counter()
+
+# Serialized callback figures keyed by (dashboard, user, dataset version, callback inputs)
+_figure_cache = OrderedDict()
+_figure_cache_bytes = 0
+_figure_cache_lock = threading.Lock()
+
+
+def _reset_stores_after_fork():
+    # Every worker keeps its own caches, a lock held by a parent thread at fork time would never be released
+    global _dataset_store_lock, _figure_cache_lock, _figure_cache_bytes
+    _dataset_store_lock = threading.Lock()
+    _figure_cache_lock = threading.Lock()
+    _dataset_store.clear()
+    _dataset_load_locks.clear()
+    _figure_cache.clear()
+    _figure_cache_bytes = 0
+
+
+os.register_at_fork(after_in_child=_reset_stores_after_fork)
+
+
+def new_dataset_version():
+    return uuid.uuid4().hex
+
+
+def put_dataset(frames, save_folder, userid, version=None):
+    version = version or new_dataset_version()
+    with _dataset_store_lock:
+        _dataset_store[(save_folder, userid)] = (version, frames)
+        _dataset_store.move_to_end((save_folder, userid))
+        while len(_dataset_store) > DATASET_STORE_MAX_ENTRIES:
+            _dataset_store.popitem(last=False)
+    return version
+
+
+def get_dataset(save_folder, userid, version, loader):
+    # Frames are shared between callbacks, so they must be treated as read-only.
+    # None when the saved data is gone, e.g. cleared in another tab, callers prevent the update
+    frames = _get_stored_dataset(save_folder, userid, version)
+    if frames is None:
+        frames = _load_dataset(save_folder, userid, version, loader)
+    elif has_app_context():
+        current_app.logger.debug(f"Dataset shared: dashboard={save_folder}, version={version}, "
+                                 f"parses={get_dataset_load_count(save_folder, userid, version)}")
+    return frames
+
+
+def _load_dataset(save_folder, userid, version, loader):
+    with _dataset_store_lock:
+        load_lock = _dataset_load_locks.setdefault((save_folder, userid), threading.Lock())
+    with load_lock:
+        # Another callback of the same update may have loaded it while this one waited
+        frames = _get_stored_dataset(save_folder, userid, version)
+        if frames is not None:
+            return frames
+
+        # The loader reads whatever is on disk, a stale tab's token (e.g. uploaded since in another tab or worker)
+        # must not label newer data, so it is stored under the version on disk
+        disk_version = _fetch_saved_dataset_version(save_folder, userid)
+        if disk_version is None:
+            return None
+        if disk_version != version:
+            # Figures this worker cached for the stale token were made from the older data
+            drop_cached_figures(save_folder, userid)
+            frames = _get_stored_dataset(save_folder, userid, disk_version)
+            if frames is not None:
+                return frames
+            version = disk_version
+
+        # Not in memory (evicted, restarted or served by another worker), so reload it from disk
+        try:
+            frames = loader()
+            put_dataset(frames, save_folder, userid, version)
+        except FileNotFoundError:
+            # Cleared while loading
+            return None
+        finally:
+            with _dataset_store_lock:
+                _dataset_load_locks.pop((save_folder, userid), None)
+
+    with _dataset_store_lock:
+        for key in [key for key in _dataset_load_counts if key[:2] == (save_folder, userid) and key[2] != version]:
+            del _dataset_load_counts[key]
+        _dataset_load_counts[(save_folder, userid, version)] += 1
+        load_count = _dataset_load_counts[(save_folder, userid, version)]
+    if has_app_context():
+        current_app.logger.info(f"Dataset parsed: dashboard={save_folder}, version={version}, parses={load_count}")
+    return frames
+
+
+def get_dataset_load_count(save_folder, userid, version):
+    with _dataset_store_lock:
+        return _dataset_load_counts[(save_folder, userid, version)]
+
+
+def _get_stored_dataset(save_folder, userid, version):
+    with _dataset_store_lock:
+        entry = _dataset_store.get((save_folder, userid))
+        if entry is not None and entry[0] == version:
+            _dataset_store.move_to_end((save_folder, userid))
+            return entry[1]
+
+
+def drop_dataset(save_folder, userid):
+    with _dataset_store_lock:
+        _dataset_store.pop((save_folder, userid), None)
+    drop_cached_figures(save_folder, userid)
+
+
+def _fetch_saved_dataset_version(save_folder, userid):
+    if check_if_saved_data_exists(['version.json'], save_folder=save_folder, userid=userid):
+        return fetch_data_from_disk('version.json', save_folder=save_folder, userid=userid)
+
+
+def fetch_dataset_version(save_folder, userid):
+    # Data saved before versioning was introduced gets a version on first load
+    if not check_if_saved_data_exists(['version.json'], save_folder=save_folder, userid=userid):
+        save_data_to_disk(new_dataset_version(), 'version.json', save_folder=save_folder, userid=userid)
+    return fetch_data_from_disk('version.json', save_folder=save_folder, userid=userid)
+
+
+def save_dataset_version(frames, save_folder, userid):
+    version = new_dataset_version()
+    save_data_to_disk(version, 'version.json', save_folder=save_folder, userid=userid)
+    # Figures of the previous version can never be requested again
+    drop_cached_figures(save_folder, userid)
+    return put_dataset(frames, save_folder, userid, version)
+
+
+def fetch_cached_figures(save_folder, userid, version, inputs, create_figures):
+    key = (save_folder, userid, version, json.dumps(inputs, sort_keys=True, default=str))
+    with _figure_cache_lock:
+        figures_json = _figure_cache.get(key)
+        if figures_json is not None:
+            _figure_cache.move_to_end(key)
+            return tuple(json.loads(figures_json))
+
+    figures = create_figures()
+    put_cached_figures(save_folder, userid, version, inputs, figures)
+    return figures
+
+
+def put_cached_figures(save_folder, userid, version, inputs, figures):
+    global _figure_cache_bytes
+    key = (save_folder, userid, version, json.dumps(inputs, sort_keys=True, default=str))
+    with _figure_cache_lock:
+        if key in _figure_cache:
+            return
+    figures_json = json.dumps(figures, cls=PlotlyJSONEncoder)
+    with _figure_cache_lock:
+        if key not in _figure_cache:
+            _figure_cache[key] = figures_json
+            _figure_cache_bytes += len(figures_json)
+        while _figure_cache_bytes > FIGURE_CACHE_MAX_BYTES and _figure_cache:
+            _, evicted_json = _figure_cache.popitem(last=False)
+            _figure_cache_bytes -= len(evicted_json)
+
+
+def drop_cached_figures(save_folder, userid):
+    global _figure_cache_bytes
+    with _figure_cache_lock:
+        for key in [key for key in _figure_cache if key[:2] == (save_folder, userid)]:
+            _figure_cache_bytes -= len(_figure_cache.pop(key))
@@ -1,6 +1,15 @@
 import os
+import json
 import shutil
 
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from plotly.utils import PlotlyJSONEncoder
+
+# Format new DataFrames are saved in, any other registered format can still be read
+STORAGE_FORMAT = os.environ.get('STORAGE_FORMAT', 'parquet')
+
 
 def save_data_to_disk(data, filename, save_folder, userid):
     DATAPATH_FOLDER = os.path.join('saved_data', save_folder)
@@ -16,12 +25,90 @@ def save_data_to_disk(data, filename, save_folder, userid):
         f.write(data)
 
 
+def save_stream_to_disk(stream, filename, save_folder, userid, chunk_size=2 ** 20):
+    # Copies a file-like object to disk chunk by chunk so it's never held in memory as a whole
+    DATAPATH_USER = os.path.join('saved_data', save_folder, userid)
+    os.makedirs(DATAPATH_USER, exist_ok=True)
+
+    path = os.path.join(DATAPATH_USER, filename)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(stream, f, chunk_size)
+    return path
+
+
 def fetch_data_from_disk(filename, save_folder, userid):
     with open(os.path.join('saved_data', save_folder, userid, filename), 'r') as f:
         data = f.read()
     return data
 
 
+def write_parquet(df, path):
+    pq.write_table(pa.Table.from_pandas(df), path, compression='zstd')
+
+
+def read_parquet(path):
+    table = pq.read_table(path, memory_map=True)
+    df = table.to_pandas()
+    # Arrow hands list columns (e.g. artists) back as arrays, restore them to python lists
+    for field in table.schema:
+        if pa.types.is_list(field.type) and field.name in df.columns:
+            df[field.name] = table.column(field.name).to_pylist()
+    return df
+
+
+def write_json(df, path):
+    df.to_json(path, date_format='iso', orient='split')
+
+
+def read_json(path):
+    return pd.read_json(path, orient='split', convert_axes=False)
+
+
+# Storage format name -> (file extension, writer, reader)
+storage_formats = {
+    'parquet': ('.parquet', write_parquet, read_parquet),
+    'json': ('.json', write_json, read_json),
+}
+
+
+def save_dataframe_to_disk(df, name, save_folder, userid, storage_format=None):
+    extension, writer, _ = storage_formats[storage_format or STORAGE_FORMAT]
+    DATAPATH_USER = os.path.join('saved_data', save_folder, userid)
+    os.makedirs(DATAPATH_USER, exist_ok=True)
+
+    # Write to a temporary file first so readers never see a partially written dataset
+    path = os.path.join(DATAPATH_USER, name + extension)
+    writer(df, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    # Remove copies of the dataset in other formats so they can't be read instead
+    for other_extension, _, _ in storage_formats.values():
+        if other_extension != extension and os.path.exists(os.path.join(DATAPATH_USER, name + other_extension)):
+            os.remove(os.path.join(DATAPATH_USER, name + other_extension))
+
+
+def fetch_dataframe_from_disk(name, save_folder, userid):
+    DATAPATH_USER = os.path.join('saved_data', save_folder, userid)
+    extension, _, reader = storage_formats[STORAGE_FORMAT]
+    if os.path.exists(os.path.join(DATAPATH_USER, name + extension)):
+        return reader(os.path.join(DATAPATH_USER, name + extension))
+
+    # Data saved in another format (e.g. the old JSON files) is migrated on first read
+    for other_extension, _, other_reader in storage_formats.values():
+        if os.path.exists(os.path.join(DATAPATH_USER, name + other_extension)):
+            df = other_reader(os.path.join(DATAPATH_USER, name + other_extension))
+            save_dataframe_to_disk(df, name, save_folder=save_folder, userid=userid)
+            return df
+
+    raise FileNotFoundError(os.path.join(DATAPATH_USER, name))
+
+
+def check_if_saved_dataframes_exist(name_list, save_folder, userid):
+    return all(any(os.path.exists(os.path.join('saved_data', save_folder, userid, name + extension))
+                   for extension, _, _ in storage_formats.values())
+               for name in name_list)
+
+
 def check_if_saved_data_exists(filename_list, save_folder, userid):
     return all(os.path.exists(os.path.join('saved_data', save_folder, userid, filename)) for filename in filename_list)
 
@@ -32,6 +119,11 @@ def clear_data_from_disk(save_folder, userid):
     if os.path.exists(DATAPATH_USER):
         shutil.rmtree(DATAPATH_USER)
 
+def get_figure_size(fig):
+    # Size in bytes of the JSON sent to the browser for the figure
+    return len(json.dumps(fig, cls=PlotlyJSONEncoder))
+
+
 def hex_to_rgba(hex_color, alpha=1.0):
     hex_color = hex_color.lstrip('#')
     r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))